@@ -117,38 +117,19 @@ export async function POST(request: NextRequest) {
     const groq = new Groq();
 
     const { data, error } = await supabase
-      .from("new_doctors")
-      .select("*")
-      .eq("locality", patientInfo.locality)
-      .eq("region", patientInfo.region)
-      .eq("speciality", specialty)
-      .returns<Doctor[]>()
-      .limit(10);
-
-    const { data: data2, error: error2 } = await supabase
-      .from("new_doctors")
-      .select("*")
-      .eq("region", patientInfo.region)
-      .eq("speciality", specialty)
-      .returns<Doctor[]>()
-      .limit(10);
-
-    if (error || error2) {
-      return NextResponse.json(
-        { error: (error || error2)?.message },
-        { status: 500 }
-      );
+      .rpc("find_doctors_by_location", {
+        p_speciality: specialty,
+        p_region: patientInfo.region,
+        p_locality: patientInfo.locality,
+        p_limit: 10,
+      })
+      .returns<Doctor[]>();
+
+    if (error) {
+      return NextResponse.json({ error: error.message }, { status: 500 });
     }
 
-    // console.log(specialty);
-
-    const uniqueDoctors = Array.from(
-      new Map(
-        [...data, ...data2].map((doctor) => [doctor.link, doctor])
-      ).values()
-    );
-    // console.log(uniqueDoctors);
-    const allDoctors: Doctor[] = uniqueDoctors.slice(0, 10);
+    const allDoctors: Doctor[] = data;
 
     const groqCompletion = await groq.chat.completions.create({
       messages: [
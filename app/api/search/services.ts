@@ -44,6 +44,8 @@ export const searchKnowledgeBaseCategories = async (query: string, selectedCateg
         .from('knowledge')
         .select('*', { count: 'exact' })
         .in('category', selectedCategories)
+        // One row per concept: its first chunk (or the whole article for rows loaded before chunking)
+        .or('chunk_index.is.null,chunk_index.eq.0')
         .range(offset, offset + pageSize - 1);
     }
 
@@ -68,27 +70,16 @@ export const searchKnowledgeBaseCategories = async (query: string, selectedCateg
 export const searchPhysicians = async (query: string, state: string, page: number = 1, pageSize: number = 20) => {
   try {
     const offset = (page - 1) * pageSize;
-    let supabaseQuery = supabase
-      .from('new_doctors')
-      .select('*', { count: 'exact', head: false })
-      .or(`first_name.ilike.%${query}%,last_name.ilike.%${query}%`)
+    // Served by the trigram index on the full name, typos included
+    const { data, error, count } = await supabase
+      .rpc('search_physicians', { p_query: query, p_region: state || undefined }, { count: 'exact' })
       .range(offset, offset + pageSize - 1);
 
-    if (state) {
-      supabaseQuery = supabaseQuery.eq('region', state);
-    }
-
-    const { data, error, count } = await supabaseQuery;
-
     if (error) {
       return { data: null, error, count: 0 };
     }
 
-    const uniqueData = Array.from(
-      new Map(data.map(item => [item.link, item])).values()
-    );
-    
-    return { data: uniqueData, error: null, count };
+    return { data, error: null, count };
   } catch (error) {
     return { data: null, error, count: 0 };
   }
@@ -0,0 +1,410 @@
+import asyncio
+import base64
+import json
+import random
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+from aiohttp import web
+from pydantic import BaseModel
+
+# Local stand-ins for everything the pipelines talk to, on one aiohttp server:
+#
+#   /directory/md/specialty/<slug>?page=N   Doximity specialty directory pages
+#   /pub/<slug>                             Doximity profile pages (ETag / 304)
+#   /v1/embeddings                          OpenAI embeddings
+#   /v1/chat/completions                    OpenAI structured completions
+#   /rest/v1/<table>                        PostgREST inserts and upserts
+#   /rest/v1/rpc/<function>                 PostgREST function calls, no-ops
+#   /bench/stats, /bench/reset              what the server has seen so far
+#
+# Every page and vector is derived from the config and the request, so two
+# runs with the same config see the same corpus.
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Daniel", "Nancy", "Matthew", "Lisa",
+    "Anthony", "Betty", "Mark", "Margaret", "Steven", "Sandra", "Priya", "Wei",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson",
+    "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Patel", "Chen",
+]
+# (name, directory slug), as listed in find_doctors.py
+SPECIALTIES = [
+    ("Cardiology", "cardiology"),
+    ("Dermatology", "dermatology"),
+    ("Endocrinology", "endocrinology"),
+    ("Family Medicine", "family-medicine"),
+    ("Gastroenterology", "gastroenterology"),
+    ("Hematology", "hematology"),
+    ("Infectious Disease", "infectious-disease"),
+    ("Internal Medicine", "internal-medicine"),
+    ("Nephrology", "nephrology"),
+    ("Neurology", "neurology"),
+    ("Oncology", "oncology"),
+    ("Pulmonology", "pulmonology"),
+]
+CITIES = [
+    ("Boston", "MA"), ("New York", "NY"), ("Philadelphia", "PA"), ("Baltimore", "MD"),
+    ("Cleveland", "OH"), ("Chicago", "IL"), ("Houston", "TX"), ("Dallas", "TX"),
+    ("Atlanta", "GA"), ("Miami", "FL"), ("Nashville", "TN"), ("Denver", "CO"),
+    ("Phoenix", "AZ"), ("Seattle", "WA"), ("Portland", "OR"), ("San Francisco", "CA"),
+    ("Los Angeles", "CA"), ("San Diego", "CA"), ("Minneapolis", "MN"), ("Rochester", "MN"),
+]
+
+# Profile slugs end in -x<number>, the doctor's position in the corpus; unlike
+# Doximity's numeric suffixes it keeps every fixture doctor a distinct person
+# to entity_resolution
+SLUG_INDEX = re.compile(r"-x(\d+)$")
+
+# "[p1] text" marks one of several items of a batched prompt
+ITEM_ID = re.compile(r"^\[(\w+)\] (.*)$", re.MULTILINE)
+
+FILLER = "<p class=\"filler\">Patient reviews, publications, hospital affiliations and awards.</p>\n"
+
+
+class ServiceConfig(BaseModel):
+    # Fixture corpus: doctors spread round-robin over the first `specialties`
+    # specialties, listed `doctors_per_page` to a directory page. Profile pages
+    # are padded to about `page_bytes`, the size of a real one.
+    seed: int = 0
+    doctors: int = 500
+    specialties: int = 5
+    doctors_per_page: int = 25
+    page_bytes: int = 40_000
+    # Seconds each endpoint takes to answer, give or take 50%
+    directory_latency: float = 0.1
+    profile_latency: float = 0.05
+    completion_latency: float = 0.5
+    embedding_latency: float = 0.2
+    insert_latency: float = 0.05
+    # Share of OpenAI requests answered 429, and the Retry-After they carry
+    completion_429_rate: float = 0.0
+    embedding_429_rate: float = 0.0
+    retry_after: float = 1.0
+    # Requests each endpoint serves at once before answering 429 with the
+    # same Retry-After, like a provider's concurrency limit; 0 is unlimited
+    profile_capacity: int = 0
+    completion_capacity: int = 0
+    embedding_capacity: int = 0
+    # Share of the items of a batched completion left out of the answer
+    batch_drop_rate: float = 0.0
+    embedding_dim: int = 1536
+
+
+def fixture_specialties(config: ServiceConfig) -> list[tuple[str, str]]:
+    return SPECIALTIES[: config.specialties]
+
+
+def fixture_doctor(config: ServiceConfig, i: int) -> dict:
+    rng = random.Random(config.seed * 1_000_003 + i)
+    first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    locality, region = rng.choice(CITIES)
+    specialty, _ = SPECIALTIES[i % config.specialties]
+    return {
+        "slug": f"{first_name}-{last_name}-md-x{i}".lower(),
+        "name": f"{first_name} {last_name}, MD",
+        "first_name": first_name,
+        "last_name": last_name,
+        "credentials": "MD",
+        "locality": locality,
+        "region": region,
+        "speciality": specialty,
+    }
+
+
+def render_profile(doctor: dict, page_bytes: int) -> str:
+    # The elements profile_parser reads, laid out like a Doximity profile
+    head = f"""<!DOCTYPE html>
+<html><head><title>Dr. {doctor['first_name']} {doctor['last_name']}</title></head>
+<body><div class="profile-head">
+<div class="profile-photo"><img src="https://cdn.example.com/photos/{doctor['slug']}.jpg"></div>
+<h1><span class="user-name-first">{doctor['first_name']}</span>
+<span class="user-name-last">{doctor['last_name']}</span>,
+<span class="user-name-credentials">{doctor['credentials']}</span></h1>
+<a class="profile-head-subtitle" href="/specialty/{doctor['speciality'].lower().replace(' ', '-')}">{doctor['speciality']}</a>
+<span itemprop="addressLocality"><a href="/cities/{doctor['locality'].lower().replace(' ', '-')}">{doctor['locality']}</a></span>,
+<span itemprop="addressRegion"><a href="/states/{doctor['region'].lower()}">{doctor['region']}</a></span>
+</div>
+"""
+    return head + FILLER * max(0, (page_bytes - len(head)) // len(FILLER)) + "</body></html>\n"
+
+
+def fill_schema(
+    schema: dict, defs: dict, text: str, name: str = "", keep=lambda: True
+) -> object:
+    # A value of the JSON schema OpenAI was asked for; enum picks and strings
+    # depend on `text`, the prompt. An array of objects with an id gets one
+    # entry per "[id] item" of the prompt (those `keep()` agrees to), filled
+    # from that item.
+    if "$ref" in schema:
+        return fill_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, text, name, keep)
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        return fill_schema(options[0], defs, text, name, keep) if options else None
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][zlib.crc32(text.encode()) % len(schema["enum"])]
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            key: fill_schema(value, defs, text, key, keep)
+            for key, value in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        items = schema.get("items", {})
+        item = defs.get(items.get("$ref", "").rsplit("/", 1)[-1], items)
+        if "id" in item.get("properties", {}) and ITEM_ID.search(text):
+            return [
+                {**fill_schema(item, defs, body, name, keep), "id": id}
+                for id, body in ITEM_ID.findall(text)
+                if keep()
+            ]
+        return [fill_schema(items, defs, text, name, keep)]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return f"{name}: {' '.join(text.split()[:12])}"
+
+
+class FakeServices:
+    def __init__(self, config: ServiceConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.reset()
+
+    def reset(self):
+        self.requests: dict[str, int] = {}
+        self.rate_limited: dict[str, int] = {}
+        self.in_flight: dict[str, int] = {}
+        self.received: dict[str, int] = {}
+        self.received_bytes: dict[str, int] = {}
+        self.keys: dict[str, set] = {}
+
+    async def _respond_after(self, endpoint: str, latency: float):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+        try:
+            await asyncio.sleep(latency * self.rng.uniform(0.5, 1.5))
+        finally:
+            self.in_flight[endpoint] -= 1
+
+    def _rate_limited(self, endpoint: str, rate: float, capacity: int = 0) -> web.Response | None:
+        # Called before _respond_after, so in_flight excludes this request
+        over_capacity = capacity and self.in_flight.get(endpoint, 0) >= capacity
+        if not over_capacity and self.rng.random() >= rate:
+            return None
+        self.rate_limited[endpoint] = self.rate_limited.get(endpoint, 0) + 1
+        return web.json_response(
+            {
+                "error": {
+                    "message": "Rate limit reached",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+            status=429,
+            headers={"Retry-After": str(self.config.retry_after)},
+        )
+
+    async def directory(self, request: web.Request) -> web.Response:
+        await self._respond_after("directory", self.config.directory_latency)
+        specialties = [slug for _, slug in fixture_specialties(self.config)]
+        slug = request.match_info["slug"]
+        if slug not in specialties:
+            raise web.HTTPNotFound()
+        column = specialties.index(slug)
+        listed = range(column, self.config.doctors, len(specialties))
+        page = int(request.query.get("page", "1"))
+        per_page = self.config.doctors_per_page
+        links = []
+        for i in listed[(page - 1) * per_page : page * per_page]:
+            doctor = fixture_doctor(self.config, i)
+            links.append(f'<li><a href="/pub/{doctor["slug"]}">{doctor["name"]}</a></li>')
+        next_link = ""
+        if page * per_page < len(listed):
+            next_link = f'<a href="/directory/md/specialty/{slug}?page={page + 1}">Next</a>'
+        return web.Response(
+            text=f"<html><body><ul>{''.join(links)}</ul>{next_link}</body></html>",
+            content_type="text/html",
+        )
+
+    async def profile(self, request: web.Request) -> web.Response:
+        limited = self._rate_limited("profile", 0.0, self.config.profile_capacity)
+        if limited:
+            return limited
+        await self._respond_after("profile", self.config.profile_latency)
+        match = SLUG_INDEX.search(request.match_info["slug"])
+        if not match or int(match.group(1)) >= self.config.doctors:
+            raise web.HTTPNotFound()
+        doctor = fixture_doctor(self.config, int(match.group(1)))
+        etag = f'"{doctor["slug"]}-{self.config.seed}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            text=render_profile(doctor, self.config.page_bytes),
+            content_type="text/html",
+            headers={"ETag": etag},
+        )
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        limited = self._rate_limited(
+            "embeddings", self.config.embedding_429_rate, self.config.embedding_capacity
+        )
+        if limited:
+            return limited
+        await self._respond_after("embeddings", self.config.embedding_latency)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dim = body.get("dimensions") or self.config.embedding_dim
+        data = []
+        for index, text in enumerate(inputs):
+            vector = np.random.default_rng(zlib.crc32(str(text).encode())).standard_normal(dim)
+            vector = (vector / np.linalg.norm(vector)).astype(np.float32)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        return web.json_response(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+        )
+
+    async def completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        limited = self._rate_limited(
+            "completions", self.config.completion_429_rate, self.config.completion_capacity
+        )
+        if limited:
+            return limited
+        await self._respond_after("completions", self.config.completion_latency)
+        prompt = "\n".join(str(message.get("content")) for message in body["messages"])
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            keep = lambda: self.rng.random() >= self.config.batch_drop_rate
+            content = json.dumps(fill_schema(schema, schema.get("$defs", {}), prompt, keep=keep))
+        else:
+            content = " ".join(prompt.split()[:12])
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        return web.json_response(
+            {
+                "id": f"chatcmpl-bench-{self.requests['completions']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content, "refusal": None},
+                        "logprobs": None,
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+    async def insert(self, request: web.Request) -> web.Response:
+        raw = await request.read()
+        await self._respond_after("insert", self.config.insert_latency)
+        table = request.match_info["table"]
+        rows = json.loads(raw)
+        rows = rows if isinstance(rows, list) else [rows]
+        on_conflict = request.query.get("on_conflict")
+        if on_conflict:
+            keys = [row.get(on_conflict) for row in rows]
+            # Postgres refuses to upsert the same key twice in one statement
+            if len(set(keys)) != len(keys):
+                return web.json_response(
+                    {
+                        "code": "21000",
+                        "details": None,
+                        "hint": None,
+                        "message": "ON CONFLICT DO UPDATE command cannot affect row a second time",
+                    },
+                    status=500,
+                )
+            self.keys.setdefault(table, set()).update(keys)
+        self.received[table] = self.received.get(table, 0) + len(rows)
+        self.received_bytes[table] = self.received_bytes.get(table, 0) + len(raw)
+        if "return=representation" in request.headers.get("Prefer", ""):
+            return web.Response(body=raw, status=201, content_type="application/json")
+        return web.Response(status=201)
+
+    async def rpc(self, request: web.Request) -> web.Response:
+        # Nothing is stored, so there is nothing for a function to read or delete
+        await request.read()
+        await self._respond_after(f"rpc/{request.match_info['function']}", self.config.insert_latency)
+        return web.json_response(0)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "tables": {
+                    table: {
+                        "rows": count,
+                        "bytes": self.received_bytes[table],
+                        "unique_keys": len(self.keys.get(table, ())),
+                    }
+                    for table, count in self.received.items()
+                },
+            }
+        )
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.add_routes(
+            [
+                web.get("/directory/md/specialty/{slug}", self.directory),
+                web.get("/pub/{slug}", self.profile),
+                web.get("/cv/{slug}", self.profile),
+                web.post("/v1/embeddings", self.embeddings),
+                web.post("/v1/chat/completions", self.completions),
+                web.post("/rest/v1/rpc/{function}", self.rpc),
+                web.post("/rest/v1/{table}", self.insert),
+                web.get("/bench/stats", self.stats),
+                web.post("/bench/reset", self.reset_stats),
+            ]
+        )
+        return app
+
+
+def serve(config: ServiceConfig, port: int):
+    web.run_app(FakeServices(config).app(), host="127.0.0.1", port=port, print=None)
+
+
+if __name__ == "__main__":
+    # python fake_services.py [port]
+    # then point the scripts at it:
+    #   OPENAI_BASE_URL=http://127.0.0.1:8080/v1 OPENAI_API_KEY=bench
+    #   NEXT_PUBLIC_SUPABASE_URL=http://127.0.0.1:8080 NEXT_PUBLIC_SUPABASE_KEY=bench
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    print(f"Serving fake Doximity, OpenAI and PostgREST on http://127.0.0.1:{port}")
+    serve(ServiceConfig(), port)
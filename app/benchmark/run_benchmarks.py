@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+from fake_services import ServiceConfig, fixture_doctor, fixture_specialties, serve
+
+# End-to-end throughput of the pipelines against fake_services.py, with no
+# network access: each pipeline runs at a fixed corpus size in a fresh process
+# (so peak RSS is its own) from a scratch directory, with the OpenAI and
+# Supabase clients pointed at the local server through their environment
+# variables. Save a run with --save and compare later runs to it with
+# --compare to see what a change did to records/sec and stage latency.
+#
+#   python run_benchmarks.py [crawl scrape upload load_data] [--save baseline.json]
+#
+# load_db.py drives a Chrome browser per worker and is not covered.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIND_DOCTORS_DIR = os.path.join(APP_DIR, "find_doctors")
+LOAD_DATA_DIR = os.path.join(APP_DIR, "load_data")
+
+# Corpus sizes of the pipelines that do not read the fake directory: records
+# in the upload export and paragraphs of load_data/text.txt to load
+UPLOAD_RECORDS = 20_000
+PARAGRAPHS = 300
+
+
+def run_crawl(module, config: ServiceConfig, base_url: str) -> int:
+    # multi_doctors.py's HTTP crawl of the specialty directories
+    from journal import ProgressJournal
+
+    specialties = [
+        [name, f"{base_url}/directory/md/specialty/{slug}"]
+        for name, slug in fixture_specialties(config)
+    ]
+    with ProgressJournal(module.JOURNAL_PATH) as journal:
+        asyncio.run(module.crawl_specialties_over_http(specialties, journal))
+    return module.metrics.items.get("doctors", 0)
+
+
+def run_scrape(module, config: ServiceConfig, base_url: str) -> int:
+    from journal import ProgressJournal
+    from models import DoctorFromFile
+    from profile_cache import ProfileCache
+
+    doctors = []
+    for i in range(config.doctors):
+        doctor = fixture_doctor(config, i)
+        doctors.append(
+            DoctorFromFile(
+                name=doctor["name"],
+                link=f"{base_url}/pub/{doctor['slug']}",
+                specialties=[doctor["speciality"]],
+            )
+        )
+    with ProgressJournal(module.JOURNAL_PATH) as journal, ProfileCache(module.CACHE_PATH) as cache:
+        asyncio.run(module.scrape_doctors(doctors, journal, cache))
+    return module.metrics.items.get("write", 0)
+
+
+def run_upload(module, config: ServiceConfig, base_url: str) -> int:
+    path = "scraped_doctors.jsonl"
+    with open(path, "w") as file:
+        for i in range(UPLOAD_RECORDS):
+            doctor = fixture_doctor(config, i)
+            record = {
+                key: doctor[key]
+                for key in ("first_name", "last_name", "credentials", "locality", "region", "speciality")
+            }
+            record["link"] = f"https://www.doximity.com/pub/{doctor['slug']}"
+            file.write(json.dumps(record) + "\n")
+    asyncio.run(module.upload_doctors(path))
+    return module.metrics.items.get("write", 0)
+
+
+def run_load_data(module, config: ServiceConfig, base_url: str) -> int:
+    from result_cache import ResultCache
+    from vector_index import VectorIndexWriter
+
+    with open(os.path.join(LOAD_DATA_DIR, "text.txt"), "r") as file:
+        paragraphs = [line.strip() for line in file if line.strip()][:PARAGRAPHS]
+    paragraphs, collapsed = module.dedupe_paragraphs(paragraphs, module.DEDUP_THRESHOLD)
+    with ResultCache(module.CACHE_PATH) as cache, VectorIndexWriter(module.INDEX_PATH) as index:
+        pipeline = asyncio.run(module.load_paragraphs(paragraphs, cache, index, collapsed))
+    return pipeline.written
+
+
+# name: (script directory, module, runner returning the records written)
+PIPELINES = {
+    "crawl": (FIND_DOCTORS_DIR, "multi_doctors", run_crawl),
+    "scrape": (FIND_DOCTORS_DIR, "bs4_scrape_doctors", run_scrape),
+    "upload": (FIND_DOCTORS_DIR, "upload_doctors_to_db", run_upload),
+    "load_data": (LOAD_DATA_DIR, "load_data", run_load_data),
+}
+
+
+def _run_pipeline(name: str, config: dict, base_url: str, unthrottled: bool, results):
+    # Body of the child process of one pipeline
+    script_dir, module_name, runner = PIPELINES[name]
+    config = ServiceConfig.model_validate(config)
+    workdir = tempfile.mkdtemp(prefix=f"aria-bench-{name}-")
+    sys.path.insert(0, script_dir)
+    os.chdir(workdir)
+    try:
+        module = importlib.import_module(module_name)
+        if unthrottled and hasattr(module, "PER_HOST_RATE"):
+            module.PER_HOST_RATE = None
+        start = time.perf_counter()
+        records = runner(module, config, base_url)
+        seconds = time.perf_counter() - start
+        # Linux reports kilobytes, macOS bytes
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss *= 1 if sys.platform == "darwin" else 1024
+        metrics = module.metrics
+        results.put(
+            {
+                "pipeline": name,
+                "records": records,
+                "seconds": seconds,
+                "records_per_second": records / seconds if seconds else 0.0,
+                "peak_rss_bytes": peak_rss,
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "p50": histogram.quantile(0.5),
+                        "p99": histogram.quantile(0.99),
+                    }
+                    for stage, histogram in metrics.latencies.items()
+                },
+                "errors": {f"{stage}/{category}": count for (stage, category), count in metrics.errors.items()},
+                "retries": metrics.retries,
+            }
+        )
+    finally:
+        os.chdir(APP_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _call(url: str, method: str = "GET") -> dict:
+    with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=5) as response:
+        return json.load(response)
+
+
+def _wait_until_up(base_url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _call(f"{base_url}/bench/stats")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_benchmarks(
+    pipelines: list[str], config: ServiceConfig, unthrottled: bool = False
+) -> list[dict]:
+    context = multiprocessing.get_context("spawn")
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = context.Process(target=serve, args=(config, port), daemon=True)
+    server.start()
+
+    # Inherited by the pipeline processes; load_dotenv does not override them
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"{base_url}/v1",
+            "NEXT_PUBLIC_SUPABASE_URL": base_url,
+            "NEXT_PUBLIC_SUPABASE_KEY": "bench",
+            "TQDM_DISABLE": "1",
+        }
+    )
+    reports = []
+    try:
+        _wait_until_up(base_url)
+        for name in pipelines:
+            _call(f"{base_url}/bench/reset", "POST")
+            results = context.Queue()
+            child = context.Process(
+                target=_run_pipeline,
+                args=(name, config.model_dump(), base_url, unthrottled, results),
+            )
+            child.start()
+            report = None
+            # Read before joining: a child blocks on exit until its result is consumed
+            while report is None and (child.is_alive() or not results.empty()):
+                try:
+                    report = results.get(timeout=1)
+                except queue.Empty:
+                    pass
+            child.join()
+            if report is None:
+                print(f"{name}: failed with exit code {child.exitcode}")
+                continue
+            report["server"] = _call(f"{base_url}/bench/stats")
+            reports.append(report)
+            print_report(report)
+    finally:
+        server.terminate()
+        server.join()
+    return reports
+
+
+def print_report(report: dict):
+    print(
+        f"{report['pipeline']}: {report['records']} records in {report['seconds']:.2f}s, "
+        f"{report['records_per_second']:.1f} records/s, "
+        f"peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB"
+    )
+    for stage, latency in report["stages"].items():
+        print(
+            f"  {stage:<10} {latency['count']:>7} x  "
+            f"p50 {latency['p50'] * 1000:8.1f} ms  p99 {latency['p99'] * 1000:8.1f} ms  "
+            f"retries {report['retries'].get(stage, 0)}"
+        )
+    for error, count in report["errors"].items():
+        print(f"  error {error}: {count}")
+    tables = report["server"]["tables"]
+    for table, seen in tables.items():
+        print(f"  sink {table}: {seen['rows']} rows, {seen['bytes'] / 2**20:.1f} MiB")
+
+
+def compare(reports: list[dict], baseline: list[dict]):
+    # Change of each measure against the saved run, as a ratio; above 1.0 is
+    # faster throughput or slower latency
+    previous = {report["pipeline"]: report for report in baseline}
+    for report in reports:
+        before = previous.get(report["pipeline"])
+        if before is None:
+            continue
+        print(
+            f"{report['pipeline']}: records/s x{report['records_per_second'] / (before['records_per_second'] or 1):.2f}, "
+            f"peak RSS x{report['peak_rss_bytes'] / before['peak_rss_bytes']:.2f}"
+        )
+        for stage, latency in report["stages"].items():
+            old = before["stages"].get(stage)
+            if old and old["p50"] and old["p99"]:
+                print(
+                    f"  {stage:<10} p50 x{latency['p50'] / old['p50']:.2f}  "
+                    f"p99 x{latency['p99'] / old['p99']:.2f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks")
+    parser.add_argument("pipelines", nargs="*", help=f"any of {', '.join(PIPELINES)} (default: all)")
+    parser.add_argument("--set", action="append", default=[], metavar="FIELD=VALUE",
+                        help="override a ServiceConfig field, e.g. --set embedding_429_rate=0.1")
+    parser.add_argument("--unthrottled", action="store_true",
+                        help="lift the scrapers' per-host request rate")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with results saved by --save")
+    args = parser.parse_args()
+    unknown = set(args.pipelines) - set(PIPELINES)
+    if unknown:
+        parser.error(f"unknown pipelines: {', '.join(sorted(unknown))}")
+
+    config = ServiceConfig.model_validate(dict(field.split("=", 1) for field in args.set))
+    reports = run_benchmarks(args.pipelines or list(PIPELINES), config, args.unthrottled)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(reports, file, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(reports, json.load(file))
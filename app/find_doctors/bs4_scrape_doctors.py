@@ -1,146 +1,172 @@
-import json
-from pydantic import BaseModel, HttpUrl
-import os
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 from tqdm import tqdm
-import multiprocessing as mp
-from supabase import create_client
-from dotenv import load_dotenv
-
-load_dotenv("../../.env.local")
-
-supabase = create_client(
-    os.getenv("NEXT_PUBLIC_SUPABASE_URL"), os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
-)
-
-
-class DoctorFromFile(BaseModel):
-    name: str
-    link: HttpUrl
-
-
-class DoctorFromSite(BaseModel):
-    first_name: str | None = None
-    last_name: str | None = None
-    credentials: str | None = None
-    link: HttpUrl
-    locality: str | None = None
-    locality_url: HttpUrl | None = None
-    region: str | None = None
-    region_url: HttpUrl | None = None
-    speciality: str | None = None
-    speciality_link: HttpUrl | None = None
-    photo_url: HttpUrl | None = None
-
-
-def get_doctor_from_site(doctor: DoctorFromFile) -> DoctorFromSite | None:
+from clients import get_supabase_client
+from entity_resolution import ProfileMatcher, read_listings
+from fetcher import ProfileFetcher
+from writer import BatchWriter
+from journal import ProgressJournal
+from metrics import Metrics
+from models import DoctorFromFile, DoctorFromSite
+from profile_cache import CachedProfile, ProfileCache, hash_fields
+from profile_parser import extract_profile_fields, normalize_fields
+from rate_control import AdaptiveLimiter
+
+# Crawl settings: requests in flight, requests started per second per host and
+# per-request timeout in seconds
+CONCURRENCY = 32
+PER_HOST_RATE = 20.0
+TIMEOUT = 30.0
+
+# Requests in flight start at INITIAL_CONCURRENCY and adapt between 1 and
+# CONCURRENCY: they grow while pages come back within LATENCY_TARGET seconds
+# and are cut on 429s, 5xx, timeouts and slower pages (see rate_control.py)
+INITIAL_CONCURRENCY = 8
+LATENCY_TARGET = 5.0
+
+# Profile page parser, "lxml" (single pass) or "bs4" (reference implementation)
+PARSER_BACKEND = "lxml"
+
+# Upload settings: rows per upsert and seconds between flushes of a partial batch
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+
+# Progress journal; links already handled by an earlier run are skipped, so
+# delete it before starting a new refresh
+JOURNAL_PATH = "scrape_progress.jsonl"
+
+# ETag / Last-Modified and parsed-field hashes kept between refreshes
+CACHE_PATH = "profile_cache.sqlite3"
+
+# Stage timings, errors and retries of the run, written when it ends
+METRICS_PATH = "bs4_scrape_doctors_metrics.prom"
+metrics = Metrics("bs4_scrape_doctors")
+
+
+def parse_doctor_from_site(link: str, html: str) -> DoctorFromSite | None:
     try:
-        site = requests.get(doctor.link)
-        if site.status_code != 200:
-            print(f"Failed to fetch {doctor.link}. Status code: {site.status_code}")
-            return None
-        soup = BeautifulSoup(site.text, "html.parser")
-        doctor_data = {"link": doctor.link}
-
-        base_url = "https://www.doximity.com{relative_link}"
-
-        first_name_elem = soup.find("span", class_="user-name-first")
-        if first_name_elem:
-            doctor_data["first_name"] = first_name_elem.text.strip()
-
-        last_name_elem = soup.find("span", class_="user-name-last")
-        if last_name_elem:
-            doctor_data["last_name"] = last_name_elem.text.strip()
-
-        credentials_elem = soup.find("span", class_="user-name-credentials")
-        if credentials_elem:
-            doctor_data["credentials"] = credentials_elem.text.strip()
-
-        speciality_elem = soup.find("a", class_="profile-head-subtitle")
-        if speciality_elem:
-            doctor_data["speciality"] = speciality_elem.text.strip()
-            doctor_data["speciality_link"] = base_url.format(
-                relative_link=speciality_elem.get("href")
-            )
-
-        locality_elem = soup.find("span", attrs={"itemprop": "addressLocality"})
-        if locality_elem:
-            doctor_data["locality"] = locality_elem.text.strip()
-            locality_link_elem = locality_elem.find("a")
-            if locality_link_elem:
-                doctor_data["locality_url"] = base_url.format(
-                    relative_link=locality_link_elem.get("href")
-                )
-
-        region_elem = soup.find("span", attrs={"itemprop": "addressRegion"})
-        if region_elem:
-            doctor_data["region"] = region_elem.text.strip()
-            region_link_elem = region_elem.find("a")
-            if region_link_elem:
-                doctor_data["region_url"] = base_url.format(
-                    relative_link=region_link_elem.get("href")
-                )
+        with metrics.time("parse"):
+            doctor_data = {"link": link, **extract_profile_fields(html, PARSER_BACKEND)}
+            return DoctorFromSite(**normalize_fields(doctor_data))
+    except Exception as e:
+        print(f"Failed to parse {link}: {e!r}")
+        return None
 
-        photo_elem = soup.find("div", class_="profile-photo")
-        if photo_elem:
-            photo_link_elem = photo_elem.find("img")
-            if photo_link_elem:
-                doctor_data["photo_url"] = photo_link_elem.get("src")
-
-        speciality_elem = soup.find("a", class_="profile-head-subtitle")
-        if speciality_elem:
-            relative_link = speciality_elem.get("href")
-            if relative_link:
-                doctor_data["speciality_link"] = base_url.format(
-                    relative_link=relative_link
-                )
 
-        # Remove unicode characters from non-link values
-        for key, value in doctor_data.items():
-            if (
-                isinstance(value, str)
-                and not key.endswith("_url")
-                and not key.endswith("_link")
+async def scrape_doctors(
+    doctors: list[DoctorFromFile], journal: ProgressJournal, cache: ProfileCache
+):
+    # Validators of pages whose rows are still waiting in the writer; they are
+    # only cached once the upsert lands so a failed write is retried next run
+    unsaved: dict[str, CachedProfile] = {}
+    # Validators of duplicate pages merged into a row, by that row's link;
+    # cached along with it, so they are not refetched in full every refresh
+    merged: dict[str, list[CachedProfile]] = {}
+
+    def mark_uploaded(rows: list[dict]):
+        cache.put([unsaved.pop(row["link"]) for row in rows if row["link"] in unsaved])
+        for row in rows:
+            cache.put(merged.pop(row["link"], []))
+        cache.commit()
+        for row in rows:
+            journal.record(row["link"], "uploaded")
+
+    def mark_failed(rows: list[dict], error: Exception):
+        for row in rows:
+            unsaved.pop(row["link"], None)
+            journal.fail(row["link"], f"upload: {error}")
+            for profile in merged.pop(row["link"], []):
+                journal.fail(profile.link, f"upload: {error}")
+
+    specialties = {str(d.link): d.specialties for d in doctors}
+    links = journal.pending(specialties)
+    matcher = ProfileMatcher()
+    limiter = AdaptiveLimiter(
+        "fetch",
+        initial=INITIAL_CONCURRENCY,
+        maximum=CONCURRENCY,
+        latency_target=LATENCY_TARGET,
+        metrics=metrics,
+    )
+
+    async with ProfileFetcher(
+        concurrency=CONCURRENCY,
+        per_host_rate=PER_HOST_RATE,
+        timeout=TIMEOUT,
+        metrics=metrics,
+        limiter=limiter,
+    ) as fetcher, BatchWriter(
+        get_supabase_client(),
+        "new_doctors",
+        on_conflict="link",
+        batch_size=BATCH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        on_written=mark_uploaded,
+        on_failed=mark_failed,
+        metrics=metrics,
+    ) as writer:
+        with tqdm(total=len(links), desc="Scraping doctor information") as pbar:
+            async for result in fetcher.fetch_all(
+                links, headers_for=cache.conditional_headers
             ):
-                doctor_data[key] = "".join(
-                    char for char in value if ord(char) < 128
-                ).strip()
-
-        return DoctorFromSite(**doctor_data)
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return None
+                pbar.update(1)
+                if result.status == 304:
+                    metrics.count("unchanged")
+                    cache.touch(result.url)
+                    journal.record(result.url, "unchanged")
+                    continue
+                if result.status != 200:
+                    reason = f"HTTP {result.status}" if result.status else result.error
+                    print(f"Failed to fetch {result.url}. Status code: {reason}")
+                    journal.fail(result.url, f"fetch: {reason}")
+                    continue
+                journal.record(result.url, "fetched")
+                doctor = parse_doctor_from_site(result.url, result.text)
+                if doctor is None:
+                    journal.fail(result.url, "parse")
+                    continue
+                journal.record(result.url, "parsed")
+                doctor.specialties = specialties.get(result.url)
+                canonical = matcher.resolve(doctor)
+                if canonical is not None:
+                    # Same doctor as a profile already queued; store its
+                    # specialties on that row instead of a second row
+                    metrics.count("merged")
+                    journal.record(result.url, "merged")
+                    merged.setdefault(str(canonical.link), []).append(
+                        CachedProfile(
+                            link=result.url,
+                            etag=result.etag,
+                            last_modified=result.last_modified,
+                            fields_hash=hash_fields(doctor),
+                        )
+                    )
+                    await writer.add(canonical)
+                    continue
+                profile = CachedProfile(
+                    link=result.url,
+                    etag=result.etag,
+                    last_modified=result.last_modified,
+                    fields_hash=hash_fields(doctor),
+                )
+                cached = cache.get(result.url)
+                if cached and cached.fields_hash == profile.fields_hash:
+                    # Page was re-served but nothing we store changed
+                    cache.put([profile])
+                    metrics.count("unchanged")
+                    journal.record(result.url, "unchanged")
+                    continue
+                unsaved[result.url] = profile
+                await writer.add(doctor)
 
 
 if __name__ == "__main__":
-    doctors: list[DoctorFromFile] = []
-    doc_dir = "doc_dir"
-
-    list_of_doctors_from_site: list[DoctorFromSite] = []
-
-    for filename in os.listdir(doc_dir):
-        if filename.startswith("doctors_") and filename.endswith(".txt"):
-            file_path = os.path.join(doc_dir, filename)
-            with open(file_path, "r") as file:
-                for line in file:
-                    doctor_name, doctor_link = line.strip().split(", ", 1)
-                    doctor_link = "https://" + doctor_link.split(" https://", 1)[1]
-                    doctors.append(DoctorFromFile(name=doctor_name, link=doctor_link))
-
-    with tqdm(total=len(doctors), desc="Scraping doctor information") as pbar:
-
-        def upload_doctor(doctor: DoctorFromSite | None):
-            if doctor:
-                supabase.table("new_doctors").insert(
-                    doctor.model_dump(mode="json")
-                ).execute()
-            pbar.update(1)
-
-        with mp.Pool(mp.cpu_count()) as pool:
-            for doctor in doctors:
-                pool.apply_async(
-                    get_doctor_from_site, args=(doctor,), callback=upload_doctor
-                )
-            pool.close()
-            pool.join()
+    # One entry per profile: link variants are canonicalized and a doctor listed
+    # under several specialties is fetched once
+    doctors = read_listings("doc_dir")
+
+    with ProgressJournal(JOURNAL_PATH) as journal, ProfileCache(CACHE_PATH) as cache:
+        try:
+            asyncio.run(scrape_doctors(doctors, journal, cache))
+        finally:
+            metrics.write(METRICS_PATH)
+            print(metrics.summary())
@@ -0,0 +1,19 @@
+import functools
+import os
+
+import supabase
+from dotenv import load_dotenv
+
+# Shared by the scripts here and in app/load_data, whichever directory they
+# run from
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../.env.local"))
+
+
+@functools.cache
+def get_supabase_client():
+    # Created on first use, so importing a script needs no credentials; once
+    # per process, so each of load_db.py's workers has its own.
+    # NEXT_PUBLIC_SUPABASE_URL can point it at a local stand-in (see app/benchmark).
+    return supabase.create_client(
+        os.getenv("NEXT_PUBLIC_SUPABASE_URL"), os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
+    )
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+import time
+
+import profile_parser
+from models import DoctorFromSite
+from profile_parser import extract_profile_fields, normalize_fields
+
+# Checks that the profile parser backends give the same DoctorFromSite for
+# every saved profile page in a directory, field by field, and times them.
+# Without an argument it runs on the committed fixture pages, which cover
+# missing fields, non-ASCII names and multi-class elements:
+#
+#   python compare_parsers.py [pages/]
+#
+# An expected.json in the directory (file name -> fields) is checked too, so
+# both backends cannot agree on a wrong answer.
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "profiles")
+FIXTURE_LINK = "https://www.doximity.com/pub/{name}"
+
+
+def parse(filename: str, html: str, backend: str) -> DoctorFromSite:
+    # The scraper's parse path (see parse_doctor_from_site), minus its error handling
+    link = FIXTURE_LINK.format(name=os.path.splitext(filename)[0])
+    return DoctorFromSite(**normalize_fields({"link": link, **extract_profile_fields(html, backend)}))
+
+
+def main(pages_dir: str = FIXTURES_DIR) -> int:
+    if profile_parser.lxml is None:
+        print("lxml is not installed; both backends would run bs4")
+        return 1
+
+    pages = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith((".html", ".htm")):
+            with open(os.path.join(pages_dir, filename), "r", encoding="utf-8") as file:
+                pages.append((filename, file.read()))
+    expected = {}
+    if os.path.exists(os.path.join(pages_dir, "expected.json")):
+        with open(os.path.join(pages_dir, "expected.json"), "r", encoding="utf-8") as file:
+            expected = json.load(file)
+
+    timings = {}
+    results = {}
+    for backend in ("bs4", "lxml"):
+        start = time.perf_counter()
+        results[backend] = [
+            parse(filename, html, backend).model_dump(mode="json", exclude={"link"})
+            for filename, html in pages
+        ]
+        timings[backend] = time.perf_counter() - start
+
+    mismatches = 0
+    for i, (filename, _) in enumerate(pages):
+        reference = results["bs4"][i]
+        candidates = {"lxml": results["lxml"][i]}
+        if filename in expected:
+            # Fields the expectation leaves out are expected to be None
+            reference = {field: expected[filename].get(field) for field in reference}
+            candidates["bs4"] = results["bs4"][i]
+        for backend, fields in candidates.items():
+            for field, value in reference.items():
+                if fields[field] != value:
+                    mismatches += 1
+                    print(f"{filename}: {field} {backend}={fields[field]!r}, expected {value!r}")
+
+    for backend, seconds in timings.items():
+        print(f"{backend}: {len(pages)} pages in {seconds:.3f}s")
+    checked = sum(filename in expected for filename, _ in pages)
+    print(f"{mismatches} mismatches ({checked} of {len(pages)} pages against expected.json)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:2]))
@@ -0,0 +1,74 @@
+import asyncio
+from typing import AsyncIterator
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml import etree
+
+from fetcher import ProfileFetcher
+
+# Settings of the HTTP directory crawl, shared by find_doctors.py and
+# multi_doctors.py: requests in flight and requests started per second. Requests
+# in flight start at INITIAL_CONCURRENCY and adapt up to CONCURRENCY, backing
+# off on 429s, 5xx and pages slower than LATENCY_TARGET seconds.
+CONCURRENCY = 16
+PER_HOST_RATE = 10.0
+INITIAL_CONCURRENCY = 4
+LATENCY_TARGET = 5.0
+
+# Same anchors the Selenium scrapers pick up, and the pagination link they click
+DOCTOR_XPATH = "//a[contains(text(), ', MD')]"
+NEXT_XPATH = "//a[normalize-space(.)='Next']"
+
+
+class DirectoryFetchError(Exception):
+    pass
+
+
+def parse_directory_page(html: str, page_url: str) -> tuple[list[str], str | None]:
+    # Returns the "<name> <link>" lines of a specialty directory page and the
+    # absolute URL of its next page, if any
+    tree = lxml.html.fromstring(html)
+    doctors = []
+    for anchor in tree.xpath(DOCTOR_XPATH):
+        doctor_name = " ".join(anchor.text_content().split())
+        doctor_link = urljoin(page_url, anchor.get("href", ""))
+        doctors.append(f"{doctor_name} {doctor_link}")
+
+    next_links = tree.xpath(NEXT_XPATH)
+    next_url = None
+    if next_links and next_links[0].get("href"):
+        next_url = urljoin(page_url, next_links[0].get("href"))
+    return doctors, next_url
+
+
+async def crawl_specialty(fetcher: ProfileFetcher, specialty_url: str) -> list[str]:
+    doctors = []
+    visited = set()
+    page_url = specialty_url
+    while page_url and page_url not in visited:
+        visited.add(page_url)
+        result = await fetcher.fetch(page_url)
+        if result.status != 200:
+            raise DirectoryFetchError(
+                f"{page_url}: {f'HTTP {result.status}' if result.status else result.error}"
+            )
+        page_doctors, page_url = parse_directory_page(result.text, result.url)
+        doctors.extend(page_doctors)
+    return doctors
+
+
+async def crawl_specialties(
+    fetcher: ProfileFetcher, specialties: list[list[str]]
+) -> AsyncIterator[tuple[str, list[str] | Exception]]:
+    # Specialties are crawled concurrently and the pages of each one in order.
+    # Yields (name, doctor lines) as each specialty finishes, or (name, error)
+    # when one could not be crawled.
+    async def crawl(name: str, url: str):
+        try:
+            return name, await crawl_specialty(fetcher, url)
+        except (DirectoryFetchError, etree.ParserError) as e:
+            return name, e
+
+    for task in asyncio.as_completed([crawl(name, url) for name, url in specialties]):
+        yield await task
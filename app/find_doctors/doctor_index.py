@@ -0,0 +1,79 @@
+import json
+import sys
+from typing import Iterable
+
+from pydantic import BaseModel
+
+from json_stream import iter_json_records
+
+
+def rank_key(doctor: dict) -> tuple:
+    # Same order as find_doctors_by_location within a tier, nulls last
+    last_name, first_name = doctor.get("last_name"), doctor.get("first_name")
+    return (last_name is None, last_name or "", first_name is None, first_name or "", doctor["link"])
+
+
+class DoctorLocationIndex:
+    # (speciality, region) -> locality -> doctors, mirroring the
+    # new_doctors_speciality_region_locality_idx index and the
+    # find_doctors_by_location function, for batch jobs and tests that run
+    # without the database
+    def __init__(self):
+        # new_doctors is unique on link and upserts keep the latest row, so do we
+        self.doctors: dict[str, dict] = {}
+        self.groups: dict[tuple[str, str], dict[str | None, list[dict]]] = {}
+        # Every doctor of a group in rank order, for the region-level fallback
+        self.regions: dict[tuple[str, str], list[dict]] = {}
+
+    def add(self, doctor: BaseModel | dict):
+        if isinstance(doctor, BaseModel):
+            doctor = doctor.model_dump(mode="json")
+        if doctor.get("speciality") and doctor.get("region"):
+            self.doctors[doctor["link"]] = doctor
+        else:
+            self.doctors.pop(doctor["link"], None)
+
+    def add_all(self, doctors: Iterable[BaseModel | dict]) -> "DoctorLocationIndex":
+        for doctor in doctors:
+            self.add(doctor)
+        return self
+
+    def finalize(self) -> "DoctorLocationIndex":
+        # Groups and ranks the doctors added so far; call before find()
+        self.groups = {}
+        self.regions = {}
+        for doctor in sorted(self.doctors.values(), key=rank_key):
+            key = (doctor["speciality"], doctor["region"])
+            self.groups.setdefault(key, {}).setdefault(doctor.get("locality"), []).append(doctor)
+            self.regions.setdefault(key, []).append(doctor)
+        return self
+
+    def find(
+        self, speciality: str, region: str, locality: str | None, limit: int = 10
+    ) -> list[dict]:
+        # Doctors in the locality first, then the rest of the region
+        key = (speciality, region)
+        ranked = self.groups.get(key, {}).get(locality, [])[:limit]
+        for doctor in self.regions.get(key, []):
+            if len(ranked) >= limit:
+                break
+            if doctor.get("locality") != locality:
+                ranked.append(doctor)
+        return ranked
+
+    def save(self, path: str):
+        with open(path, "w") as file:
+            json.dump(list(self.doctors.values()), file)
+
+    @classmethod
+    def load(cls, path: str) -> "DoctorLocationIndex":
+        return cls().add_all(iter_json_records(path)).finalize()
+
+
+if __name__ == "__main__":
+    # python doctor_index.py scraped_doctors.json doctor_index.json
+    source, target = sys.argv[1:3]
+    index = DoctorLocationIndex().add_all(iter_json_records(source))
+    index.save(target)
+    index.finalize()
+    print(f"Indexed {len(index.doctors)} doctors in {len(index.groups)} (speciality, region) groups")
@@ -0,0 +1,194 @@
+import json
+import os
+import sys
+from typing import Iterable
+
+import numpy as np
+from pydantic import BaseModel
+
+from json_stream import iter_json_records
+from models import DoctorFromSite
+
+# Low-cardinality columns stored as int32 codes into a per-column dictionary
+CATEGORY_COLUMNS = ["speciality", "region", "locality"]
+# Everything else stored as concatenated UTF-8 with int64 offsets
+STRING_COLUMNS = [
+    "first_name",
+    "last_name",
+    "credentials",
+    "link",
+    "locality_url",
+    "region_url",
+    "speciality_link",
+    "photo_url",
+]
+# Lists stored as JSON text in the same layout as the string columns
+LIST_COLUMNS = ["specialties"]
+TEXT_COLUMNS = STRING_COLUMNS + LIST_COLUMNS
+COLUMNS = list(DoctorFromSite.model_fields)
+
+NULL_CODE = -1
+
+
+def write_snapshot(records: Iterable[BaseModel | dict], path: str) -> int:
+    # Writes doctor records to a columnar snapshot directory in one pass
+    os.makedirs(path, exist_ok=True)
+    dictionaries = {column: {} for column in CATEGORY_COLUMNS}
+    codes = {column: [] for column in CATEGORY_COLUMNS}
+    offsets = {column: [0] for column in TEXT_COLUMNS}
+    valid = {column: [] for column in TEXT_COLUMNS}
+    files = {column: open(os.path.join(path, f"{column}.bin"), "wb") for column in TEXT_COLUMNS}
+
+    count = 0
+    try:
+        for record in records:
+            if isinstance(record, BaseModel):
+                record = record.model_dump(mode="json")
+            for column in CATEGORY_COLUMNS:
+                value = record.get(column)
+                if value is None:
+                    codes[column].append(NULL_CODE)
+                else:
+                    codes[column].append(
+                        dictionaries[column].setdefault(value, len(dictionaries[column]))
+                    )
+            for column in TEXT_COLUMNS:
+                value = record.get(column)
+                if column in LIST_COLUMNS and value is not None:
+                    value = json.dumps(value)
+                data = value.encode() if value is not None else b""
+                files[column].write(data)
+                offsets[column].append(offsets[column][-1] + len(data))
+                valid[column].append(value is not None)
+            count += 1
+    finally:
+        for file in files.values():
+            file.close()
+
+    for column in CATEGORY_COLUMNS:
+        np.save(os.path.join(path, f"{column}.npy"), np.array(codes[column], dtype=np.int32))
+    for column in TEXT_COLUMNS:
+        np.save(os.path.join(path, f"{column}.off.npy"), np.array(offsets[column], dtype=np.int64))
+        np.save(os.path.join(path, f"{column}.valid.npy"), np.array(valid[column], dtype=bool))
+
+    with open(os.path.join(path, "meta.json"), "w") as file:
+        json.dump(
+            {
+                "count": count,
+                "dictionaries": {
+                    column: list(values) for column, values in dictionaries.items()
+                },
+            },
+            file,
+        )
+    return count
+
+
+class DoctorSnapshot:
+    # Read side of a snapshot. Every column is memory-mapped, so opening is cheap
+    # and a query only touches the code columns plus the rows it returns.
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            meta = json.load(file)
+        self.count = meta["count"]
+        self.dictionaries: dict[str, list[str]] = meta["dictionaries"]
+        self.lookup = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in self.dictionaries.items()
+        }
+        self.codes = {
+            column: self._load(f"{column}.npy") for column in CATEGORY_COLUMNS
+        }
+        # Snapshots written before a list column existed read it as all nulls
+        text_columns = [
+            column
+            for column in TEXT_COLUMNS
+            if os.path.exists(os.path.join(path, f"{column}.bin"))
+        ]
+        self.offsets = {column: self._load(f"{column}.off.npy") for column in text_columns}
+        self.valid = {column: self._load(f"{column}.valid.npy") for column in text_columns}
+        self.data = {
+            column: self._map_bytes(f"{column}.bin") for column in text_columns
+        }
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, name), mmap_mode="r")
+
+    def _map_bytes(self, name: str) -> np.ndarray:
+        file_path = os.path.join(self.path, name)
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(file_path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def values(self, column: str) -> list[str]:
+        return self.dictionaries[column]
+
+    def mask(
+        self,
+        speciality: str | None = None,
+        region: str | None = None,
+        locality: str | None = None,
+    ) -> np.ndarray:
+        # Boolean row mask for equality filters; None means "any value"
+        mask = np.ones(self.count, dtype=bool)
+        for column, value in (
+            ("speciality", speciality),
+            ("region", region),
+            ("locality", locality),
+        ):
+            if value is None:
+                continue
+            code = self.lookup[column].get(value)
+            if code is None:
+                return np.zeros(self.count, dtype=bool)
+            mask &= self.codes[column] == code
+        return mask
+
+    def find_rows(self, limit: int | None = None, **filters) -> np.ndarray:
+        rows = np.flatnonzero(self.mask(**filters))
+        return rows[:limit] if limit is not None else rows
+
+    def count_matching(self, **filters) -> int:
+        return int(self.mask(**filters).sum())
+
+    def _string(self, column: str, row: int) -> str | None:
+        if column not in self.valid or not self.valid[column][row]:
+            return None
+        start, end = self.offsets[column][row], self.offsets[column][row + 1]
+        return self.data[column][start:end].tobytes().decode()
+
+    def row(self, row: int) -> dict:
+        record = {}
+        for column in COLUMNS:
+            if column in self.codes:
+                code = int(self.codes[column][row])
+                record[column] = None if code == NULL_CODE else self.dictionaries[column][code]
+            elif column in LIST_COLUMNS:
+                value = self._string(column, row)
+                record[column] = json.loads(value) if value is not None else None
+            else:
+                record[column] = self._string(column, row)
+        return record
+
+    def find(self, limit: int | None = None, **filters) -> list[dict]:
+        # e.g. snapshot.find(speciality="Cardiology", region="MA", locality="Boston")
+        return [self.row(int(row)) for row in self.find_rows(limit, **filters)]
+
+
+if __name__ == "__main__":
+    # python doctor_snapshot.py export scraped_doctors.json doctor_snapshot
+    # python doctor_snapshot.py query doctor_snapshot speciality=Cardiology region=MA
+    command, source, *rest = sys.argv[1:]
+    if command == "export":
+        count = write_snapshot(iter_json_records(source), rest[0])
+        print(f"Wrote {count} doctors to {rest[0]}")
+    elif command == "query":
+        snapshot = DoctorSnapshot(source)
+        filters = dict(arg.split("=", 1) for arg in rest)
+        for doctor in snapshot.find(limit=20, **filters):
+            print(json.dumps(doctor))
+        print(f"{snapshot.count_matching(**filters)} matching of {len(snapshot)}")
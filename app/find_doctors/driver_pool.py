@@ -0,0 +1,48 @@
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+
+class ManagedDriver:
+    # A long-lived headless Chrome session that is reused across pages. It is
+    # started on first use, checked before every page, and replaced after
+    # `max_pages` pages or as soon as it stops responding.
+    def __init__(self, max_pages: int = 200, headless: bool = True):
+        self.max_pages = max_pages
+        self.headless = headless
+        self.driver: webdriver.Chrome | None = None
+        self.pages = 0
+        self.restarts = 0
+
+    def _start(self):
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument("--headless=new")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        self.driver = webdriver.Chrome(options=options)
+        self.pages = 0
+
+    def _healthy(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except WebDriverException:
+            return False
+
+    def get(self) -> webdriver.Chrome:
+        if self.driver is not None and (
+            self.pages >= self.max_pages or not self._healthy()
+        ):
+            self.quit()
+            self.restarts += 1
+        if self.driver is None:
+            self._start()
+        self.pages += 1
+        return self.driver
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
@@ -0,0 +1,146 @@
+import os
+import re
+import sys
+from collections import Counter
+from typing import Iterable
+from urllib.parse import urlsplit
+
+from models import DoctorFromFile, DoctorFromSite
+
+PROFILE_BASE = "https://www.doximity.com/pub/"
+
+# /cv/<slug> and /pub/<slug> are the same profile, and listings sometimes link
+# a page of it as /pub/<slug>/1
+PROFILE_PATH = re.compile(r"^/(?:cv|pub)/([^/]+)(?:/\d+)?/?$")
+
+# Doximity tells apart doctors sharing a name with a numeric or hex suffix
+# (-md-1, -md-slash-1, -md-slash-1-1, -md-8dd03a35); these are different
+# profiles that may or may not be the same person
+SLUG_SUFFIX = re.compile(r"(?:-slash)?(?:-\d+)+$|-[0-9a-f]{8}$")
+
+CREDENTIALS = re.compile(r",.*$")
+NAME_PART = re.compile(r"[a-z]+")
+
+
+def canonical_link(url: str) -> str:
+    # One spelling per Doximity profile; other URLs only lose their query,
+    # fragment and trailing slash
+    parts = urlsplit(url.strip())
+    match = PROFILE_PATH.match(parts.path)
+    if parts.netloc.lower().endswith("doximity.com") and match:
+        return PROFILE_BASE + match.group(1).lower()
+    return f"{parts.scheme}://{parts.netloc}{parts.path.rstrip('/')}"
+
+
+def base_slug(link: str) -> str:
+    return SLUG_SUFFIX.sub("", link.rsplit("/", 1)[-1])
+
+
+def name_key(first_name: str | None, last_name: str | None = None) -> str | None:
+    # Blocking key: first and last name, lower case, without credentials,
+    # initials or punctuation. Called with one argument it splits a listing
+    # name such as "A. Michael Lincoff, MD".
+    if last_name is None:
+        parts = NAME_PART.findall(CREDENTIALS.sub("", (first_name or "").lower()))
+    else:
+        parts = NAME_PART.findall(f"{first_name or ''} {last_name}".lower())
+    parts = [part for part in parts if len(part) > 1]
+    if not parts:
+        return None
+    return f"{parts[0]} {parts[-1]}"
+
+
+def specialty_from_filename(filename: str) -> str | None:
+    # doctors_Cardiology.txt -> Cardiology
+    name = os.path.basename(filename)
+    if name.startswith("doctors_") and name.endswith(".txt"):
+        return name[len("doctors_") : -len(".txt")]
+    return None
+
+
+def read_listings(doc_dir: str) -> list[DoctorFromFile]:
+    # Every doctor listed in the doctors_<specialty>.txt files, once per
+    # profile, with the specialties of every listing they appeared in
+    listings: dict[str, DoctorFromFile] = {}
+    for filename in sorted(os.listdir(doc_dir)):
+        specialty = specialty_from_filename(filename)
+        if specialty is None:
+            continue
+        with open(os.path.join(doc_dir, filename), "r") as file:
+            for line in file:
+                line = line.strip()
+                if " https://" not in line:
+                    continue
+                name, link = line.rsplit(" https://", 1)
+                link = canonical_link("https://" + link)
+                listing = listings.get(link)
+                if listing is None:
+                    listings[link] = DoctorFromFile(name=name, link=link, specialties=[specialty])
+                elif specialty not in listing.specialties:
+                    listing.specialties.append(specialty)
+    return list(listings.values())
+
+
+class ProfileMatcher:
+    # Resolves scraped profiles that are one doctor under two links. Profiles are
+    # blocked by normalized name and only compared within a block; two match when
+    # their links differ only by a disambiguation suffix and everything the
+    # profile says about the doctor agrees.
+    def __init__(self):
+        self.blocks: dict[str, list[DoctorFromSite]] = {}
+        self.merged = 0
+
+    @staticmethod
+    def _fingerprint(doctor: DoctorFromSite) -> tuple:
+        return (
+            base_slug(str(doctor.link)),
+            doctor.credentials,
+            doctor.locality,
+            doctor.region,
+            doctor.speciality,
+        )
+
+    def resolve(self, doctor: DoctorFromSite) -> DoctorFromSite | None:
+        # Returns the doctor already seen that `doctor` is a duplicate of, with
+        # the specialties of both, or None (and remembers `doctor`) if it is new
+        key = name_key(doctor.first_name, doctor.last_name or "")
+        if key is None or doctor.region is None:
+            return None
+        block = self.blocks.setdefault(key, [])
+        fingerprint = self._fingerprint(doctor)
+        for existing in block:
+            if self._fingerprint(existing) == fingerprint:
+                existing.specialties = merge_specialties(existing.specialties, doctor.specialties)
+                self.merged += 1
+                return existing
+        block.append(doctor)
+        return None
+
+
+def merge_specialties(*lists: Iterable[str] | None) -> list[str]:
+    merged = []
+    for specialties in lists:
+        for specialty in specialties or []:
+            if specialty not in merged:
+                merged.append(specialty)
+    return merged
+
+
+if __name__ == "__main__":
+    # python entity_resolution.py doc_dir
+    doc_dir = sys.argv[1] if len(sys.argv) > 1 else "doc_dir"
+    lines = sum(
+        1
+        for filename in os.listdir(doc_dir)
+        if specialty_from_filename(filename)
+        for line in open(os.path.join(doc_dir, filename))
+        if line.strip()
+    )
+    listings = read_listings(doc_dir)
+    # Profiles that ProfileMatcher may merge once their pages are parsed
+    candidates = Counter((name_key(listing.name), base_slug(str(listing.link))) for listing in listings)
+    print(
+        f"{lines} listing lines -> {len(listings)} profiles to fetch, "
+        f"{sum(len(listing.specialties) > 1 for listing in listings)} in several specialties, "
+        f"{sum(count for count in candidates.values() if count > 1)} merge candidates"
+    )
@@ -0,0 +1,163 @@
+import asyncio
+import contextlib
+import time
+from typing import AsyncIterator, Callable, Iterable
+from urllib.parse import urlsplit
+
+import aiohttp
+from pydantic import BaseModel
+
+from rate_control import AdaptiveLimiter, retry_after
+
+USER_AGENT = "Mozilla/5.0 (compatible; aria-doctor-crawler/1.0)"
+
+
+class FetchResult(BaseModel):
+    url: str
+    status: int | None = None
+    text: str | None = None
+    headers: dict[str, str] = {}
+    etag: str | None = None
+    last_modified: str | None = None
+    error: str | None = None
+    elapsed: float = 0.0
+    attempts: int = 0
+
+
+class HostRateLimiter:
+    # Spaces out requests to the same host so that at most `rate` start per second
+    def __init__(self, rate: float | None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot: dict[str, float] = {}
+        self.lock = asyncio.Lock()
+
+    async def wait(self, host: str):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class ProfileFetcher:
+    # One keep-alive connection pool shared by every request of a crawl. Use as
+    # `async with ProfileFetcher(...) as fetcher:` so the pool is closed at the end.
+    def __init__(
+        self,
+        concurrency: int = 32,
+        per_host_rate: float | None = 20.0,
+        timeout: float = 30.0,
+        retries: int = 2,
+        backoff: float = 1.0,
+        metrics=None,
+        limiter: AdaptiveLimiter | None = None,
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = HostRateLimiter(per_host_rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session: aiohttp.ClientSession | None = None
+        # Optional metrics.Metrics: fetch latency, retries, errors and in-flight requests
+        self.metrics = metrics
+        # Optional adaptive limit on requests in flight, below `concurrency`
+        self.limiter = limiter
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, ttl_dns_cache=300, keepalive_timeout=30
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": USER_AGENT},
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    async def _get(self, url: str, headers: dict[str, str] | None) -> FetchResult:
+        start = time.perf_counter()
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                text = await response.text() if response.status == 200 else None
+                return FetchResult(
+                    url=url,
+                    status=response.status,
+                    text=text,
+                    headers=dict(response.headers),
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    elapsed=time.perf_counter() - start,
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return FetchResult(
+                url=url,
+                error=str(e) or type(e).__name__,
+                elapsed=time.perf_counter() - start,
+            )
+
+    async def fetch(self, url: str, headers: dict[str, str] | None = None) -> FetchResult:
+        async with self.semaphore:
+            for attempt in range(1, self.retries + 2):
+                await self.rate_limiter.wait(urlsplit(url).netloc)
+                async with (
+                    self.limiter.request() if self.limiter else contextlib.nullcontext()
+                ) as request:
+                    result = await self._get(url, headers)
+                    if request and result.status == 429:
+                        request.throttled(retry_after(result.headers))
+                    elif request and (result.error is not None or result.status >= 500):
+                        request.overloaded(retry_after(result.headers))
+                result.attempts = attempt
+                if self.metrics:
+                    self.metrics.observe("fetch", result.elapsed)
+                # Only connection errors, 429s and 5xx are worth another try
+                if result.error is None and result.status != 429 and result.status < 500:
+                    break
+                if attempt <= self.retries:
+                    if self.metrics:
+                        self.metrics.retry("fetch")
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            if self.metrics:
+                self.metrics.count("fetch")
+                if result.error is not None:
+                    self.metrics.error("fetch", "connection")
+                elif result.status >= 400:
+                    self.metrics.error("fetch", f"http_{result.status}")
+            return result
+
+    async def fetch_all(
+        self,
+        urls: Iterable[str],
+        headers_for: Callable[[str], dict[str, str]] | None = None,
+    ) -> AsyncIterator[FetchResult]:
+        # Keeps a bounded window of tasks in flight instead of scheduling every
+        # link up front, and yields results in completion order. `headers_for`
+        # supplies per-URL request headers, e.g. conditional request validators.
+        urls = iter(urls)
+        pending: set[asyncio.Task] = set()
+        window = self.concurrency * 2
+
+        def refill():
+            for url in urls:
+                headers = headers_for(url) if headers_for else None
+                pending.add(asyncio.create_task(self.fetch(url, headers)))
+                if len(pending) >= window:
+                    break
+
+        refill()
+        while pending:
+            if self.metrics:
+                self.metrics.queue_depth("fetch_in_flight", len(pending))
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+            refill()
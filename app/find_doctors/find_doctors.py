@@ -1,19 +1,25 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import os
-import supabase
-from dotenv import load_dotenv
-
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
-
-load_dotenv("../../.env.local")
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
+import asyncio
+from directory_crawler import (
+    CONCURRENCY,
+    INITIAL_CONCURRENCY,
+    LATENCY_TARGET,
+    PER_HOST_RATE,
+    crawl_specialties,
+)
+from fetcher import ProfileFetcher
+from journal import ProgressJournal
+from metrics import Metrics
+from rate_control import AdaptiveLimiter
+
+# Directory pages are fetched over plain HTTP; set this to fall back to clicking
+# through them in a Selenium browser
+USE_SELENIUM = False
+
+if USE_SELENIUM:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    from selenium.webdriver.common.by import By
 
 specialties_urls = [
     ["Allergy & Immunology", "https://www.doximity.com/directory/md/specialty/allergy-immunology"],
@@ -77,65 +83,118 @@ specialties_urls = [
 
 id = 0
 
-for specialty in specialties_urls:
-    driver.get(specialty[1])
-
-    while True:
-        doctors = driver.find_elements(By.XPATH, "//a[contains(text(), ', MD')]")    
-        for doctor in doctors:
-            doctor_name = doctor.text
-            doctor_link = doctor.get_attribute('href')
-            with open('doctors.txt', 'w') as file:
-                file.write(f"{doctor_name} {doctor_link}\n")
-
-            # # Visit doctor detail page
-            # driver.get(doctor_link)
-            # city_element = driver.find_element(By.CSS_SELECTOR, 'span[itemprop="addressLocality"]')
-            # state_element = driver.find_element(By.CSS_SELECTOR, 'span[itemprop="addressRegion"]')
-            # speciality_element = driver.find_element(By.CSS_SELECTOR, 'a.profile-head-subtitle')
-            # subspecialty_text = ""
-            # job_title_text = ""
-
-            # # Try to find the subspecialty
-            # try:
-            #     subspecialty_element = driver.find_element(By.CSS_SELECTOR, 'p.user-subspecialty')
-            #     subspecialty_text = subspecialty_element.text
-            # except:
-            #     pass  # If not found, just continue
-
-            # # Try to find the job title
-            # try:
-            #     job_title_element = driver.find_element(By.CSS_SELECTOR, 'p.user-job-title[itemprop="jobTitle"]')
-            #     job_title_text = job_title_element.text
-            # except:
-            #     pass  # If not found, just continue
-
-            # # Combine them with a comma if both exist
-            # if subspecialty_text and job_title_text:
-            #     combined_text = f"{subspecialty_text}, {job_title_text}"
-            # else:
-            #     combined_text = subspecialty_text or job_title_text  # If only one exists, use that
-
-            
-            # # Save the data to Supabase later
-            # supabase_client.table('doctors').insert({
-            #     'id': id,
-            #     'name': doctor_name,
-            #     'city': city_element.text,
-            #     'state': state_element.text,
-            #     'specialty': speciality_element.text,
-            #     'bio': combined_text
-            # }).execute()
-            # id = id + 1
-        
-        # Click next button to go to the next page
+# Progress journal; specialties whose listing was already saved are skipped
+JOURNAL_PATH = "find_doctors_progress.jsonl"
+
+METRICS_PATH = "find_doctors_metrics.prom"
+metrics = Metrics("find_doctors")
+
+
+async def crawl_over_http(specialties, journal):
+    limiter = AdaptiveLimiter(
+        "fetch",
+        initial=INITIAL_CONCURRENCY,
+        maximum=CONCURRENCY,
+        latency_target=LATENCY_TARGET,
+        metrics=metrics,
+    )
+    async with ProfileFetcher(
+        concurrency=CONCURRENCY, per_host_rate=PER_HOST_RATE, metrics=metrics, limiter=limiter
+    ) as fetcher:
+        async for specialty_name, doctors in crawl_specialties(fetcher, specialties):
+            if isinstance(doctors, Exception):
+                metrics.error("crawl", type(doctors).__name__)
+                journal.fail(specialty_name, str(doctors))
+                continue
+            metrics.count("doctors", len(doctors))
+            with open('doctors.txt', 'a') as file:
+                for doctor in doctors:
+                    file.write(f"{doctor}\n")
+            journal.record(specialty_name, "fetched")
+
+
+def crawl_with_selenium(specialties, journal):
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
+    try:
+        for specialty in specialties:
+            with metrics.time("fetch"):
+                driver.get(specialty[1])
+
+            while True:
+                doctors = driver.find_elements(By.XPATH, "//a[contains(text(), ', MD')]")    
+                for doctor in doctors:
+                    doctor_name = doctor.text
+                    doctor_link = doctor.get_attribute('href')
+                    with open('doctors.txt', 'a') as file:
+                        file.write(f"{doctor_name} {doctor_link}\n")
+
+                    # # Visit doctor detail page
+                    # driver.get(doctor_link)
+                    # city_element = driver.find_element(By.CSS_SELECTOR, 'span[itemprop="addressLocality"]')
+                    # state_element = driver.find_element(By.CSS_SELECTOR, 'span[itemprop="addressRegion"]')
+                    # speciality_element = driver.find_element(By.CSS_SELECTOR, 'a.profile-head-subtitle')
+                    # subspecialty_text = ""
+                    # job_title_text = ""
+
+                    # # Try to find the subspecialty
+                    # try:
+                    #     subspecialty_element = driver.find_element(By.CSS_SELECTOR, 'p.user-subspecialty')
+                    #     subspecialty_text = subspecialty_element.text
+                    # except:
+                    #     pass  # If not found, just continue
+
+                    # # Try to find the job title
+                    # try:
+                    #     job_title_element = driver.find_element(By.CSS_SELECTOR, 'p.user-job-title[itemprop="jobTitle"]')
+                    #     job_title_text = job_title_element.text
+                    # except:
+                    #     pass  # If not found, just continue
+
+                    # # Combine them with a comma if both exist
+                    # if subspecialty_text and job_title_text:
+                    #     combined_text = f"{subspecialty_text}, {job_title_text}"
+                    # else:
+                    #     combined_text = subspecialty_text or job_title_text  # If only one exists, use that
+
+
+                    # # Save the data to Supabase later
+                    # get_supabase_client().table('doctors').insert({
+                    #     'id': id,
+                    #     'name': doctor_name,
+                    #     'city': city_element.text,
+                    #     'state': state_element.text,
+                    #     'specialty': speciality_element.text,
+                    #     'bio': combined_text
+                    # }).execute()
+                    # id = id + 1
+
+                # Click next button to go to the next page
+                try:
+                    next_button = driver.find_element(By.LINK_TEXT, 'Next')
+                    with metrics.time("fetch"):
+                        next_button.click()
+                except:
+                    break  # No more pages
+
+            journal.record(specialty[0], "fetched")
+    finally:
+        driver.quit()
+
+
+def main():
+    with ProgressJournal(JOURNAL_PATH) as journal:
+        specialties = [
+            specialty for specialty in specialties_urls if journal.status(specialty[0]) != "fetched"
+        ]
         try:
-            next_button = driver.find_element(By.LINK_TEXT, 'Next')
-            next_button.click()
-        except:
-            break  # No more pages
-
-
-
+            if not USE_SELENIUM:
+                asyncio.run(crawl_over_http(specialties, journal))
+            else:
+                crawl_with_selenium(specialties, journal)
+        finally:
+            metrics.write(METRICS_PATH)
+            print(metrics.summary())
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import unicodedata
+from typing import Iterable, Literal
+
+import numpy as np
+from pydantic import BaseModel
+
+from doctor_index import rank_key
+from json_stream import iter_json_records
+
+# Offline gazetteer: state code (as in data/states.json) -> the state's
+# population center and its cities' coordinates
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "../../data/cities.json")
+EARTH_RADIUS_KM = 6371.0
+# Points per leaf of the KD-tree, compared in one vectorized step
+LEAF_SIZE = 16
+
+WORD = re.compile(r"[a-z0-9]+")
+ABBREVIATIONS = {"st": "saint", "ste": "sainte", "ft": "fort", "mt": "mount"}
+
+
+def normalize_place(name: str | None) -> str:
+    # "St. Louis" and "Saint Louis" -> "saint louis"
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    words = WORD.findall(name.lower().replace("'", ""))
+    if words and words[0] in ABBREVIATIONS:
+        words[0] = ABBREVIATIONS[words[0]]
+    return " ".join(words)
+
+
+class Geocode(BaseModel):
+    lat: float
+    lon: float
+    # "city" when the locality is in the gazetteer, "state" when only the
+    # region is and the point is the state's population center
+    precision: Literal["city", "state"]
+
+
+class Gazetteer:
+    def __init__(self, states: dict[str, dict], digest: str = ""):
+        self.centers = {code: tuple(state["center"]) for code, state in states.items()}
+        self.cities = {
+            code: {normalize_place(name): tuple(point) for name, point in state["cities"].items()}
+            for code, state in states.items()
+        }
+        self.digest = digest
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        with open(path, "rb") as file:
+            data = file.read()
+        return cls(json.loads(data), hashlib.sha256(data).hexdigest())
+
+    def geocode(self, locality: str | None, region: str | None) -> Geocode | None:
+        # None when the region is not a known state code
+        region = (region or "").strip().upper()
+        if region not in self.centers:
+            return None
+        cities = self.cities[region]
+        name = normalize_place(locality)
+        point = cities.get(name) or cities.get(name.removesuffix(" city"))
+        if point:
+            return Geocode(lat=point[0], lon=point[1], precision="city")
+        lat, lon = self.centers[region]
+        return Geocode(lat=lat, lon=lon, precision="state")
+
+
+class GeocodeCache:
+    # Geocodes of (locality, region) pairs across runs, in a JSON file; it is
+    # discarded when the gazetteer changes. Use as
+    # `with GeocodeCache(path, gazetteer) as geocodes:` so it is saved at the end.
+    def __init__(self, path: str, gazetteer: Gazetteer):
+        self.path = path
+        self.gazetteer = gazetteer
+        self.geocodes: dict[str, Geocode | None] = {}
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                cached = json.load(file)
+            if cached.get("gazetteer") == gazetteer.digest:
+                self.geocodes = {
+                    key: Geocode.model_validate(value) if value else None
+                    for key, value in cached["geocodes"].items()
+                }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def geocode(self, locality: str | None, region: str | None) -> Geocode | None:
+        key = f"{(region or '').strip().upper()}|{normalize_place(locality)}"
+        if key not in self.geocodes:
+            self.misses += 1
+            self.geocodes[key] = self.gazetteer.geocode(locality, region)
+        return self.geocodes[key]
+
+    def save(self):
+        with open(self.path, "w") as file:
+            json.dump(
+                {
+                    "gazetteer": self.gazetteer.digest,
+                    "geocodes": {
+                        key: geocode.model_dump() if geocode else None
+                        for key, geocode in self.geocodes.items()
+                    },
+                },
+                file,
+            )
+
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    # Points on the unit sphere, where the straight-line (chord) distance
+    # orders pairs the same way the great-circle distance does
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def distance_km(a: Geocode, b: Geocode) -> float:
+    return chord_to_km(float(np.linalg.norm(unit_vectors(a.lat, a.lon) - unit_vectors(b.lat, b.lon))))
+
+
+class KDTree:
+    # Static KD-tree over 3-D points. nearest() returns the k closest points
+    # as (index, distance) pairs; among equally distant points the lower
+    # index wins, so callers control tie order by how they order the points.
+    def __init__(self, points: np.ndarray, leaf_size: int = LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.leaf_size = leaf_size
+        # Node i: (start, end, split dimension, split value, left, right) over
+        # self.order; leaves have dimension -1
+        self.nodes: list[tuple[int, int, int, float, int, int]] = []
+        self.order = np.arange(len(self.points))
+        if len(self.points):
+            self._build(0, len(self.points))
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self.nodes)
+        self.nodes.append((start, end, -1, 0.0, -1, -1))
+        if end - start <= self.leaf_size:
+            return node
+        indices = self.order[start:end]
+        points = self.points[indices]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        # Median split; stable, so a leaf keeps its indices ascending
+        indices = indices[np.argsort(points[:, dim], kind="stable")]
+        self.order[start:end] = indices
+        middle = (start + end) // 2
+        split = float(self.points[indices[middle - start], dim])
+        left = self._build(start, middle)
+        right = self._build(middle, end)
+        self.nodes[node] = (start, end, dim, split, left, right)
+        return node
+
+    def nearest(self, point, k: int) -> list[tuple[int, float]]:
+        if not self.nodes or k <= 0:
+            return []
+        point = np.asarray(point, dtype=np.float64)
+        # Max-heap of the k best so far as (-distance, -index): the root is the
+        # farthest, and of equally far points the highest index
+        best: list[tuple[float, int]] = []
+
+        def visit(node: int):
+            start, end, dim, split, left, right = self.nodes[node]
+            if dim < 0:
+                indices = self.order[start:end]
+                distances = np.linalg.norm(self.points[indices] - point, axis=1)
+                for index, distance in zip(indices.tolist(), distances.tolist()):
+                    entry = (-distance, -index)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+                return
+            offset = point[dim] - split
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            # Equally distant points on the far side may still win on index,
+            # so only a strictly farther plane is pruned
+            if len(best) < k or abs(offset) <= -best[0][0]:
+                visit(far)
+
+        visit(0)
+        return [(-index, -distance) for distance, index in sorted(best, reverse=True)]
+
+
+def place_key(speciality: str, region: str | None, locality: str | None) -> tuple[str, str, str]:
+    return speciality, (region or "").strip().upper(), normalize_place(locality)
+
+
+class NearestDoctorIndex:
+    # Doctors by speciality in one KD-tree each, answering "the k doctors of a
+    # speciality nearest to a point" in a single search. A doctor is placed at
+    # the gazetteer coordinates of their locality; one whose locality is not in
+    # the gazetteer has no real position, so they stay out of the trees and are
+    # only ranked by place, after the doctors with a distance. Doctors at the
+    # same point keep find_doctors_by_location's name order.
+    def __init__(self, geocoder: Gazetteer | GeocodeCache | None = None):
+        self.geocoder = geocoder
+        self.doctors: dict[str, dict] = {}
+        self.trees: dict[str, tuple[KDTree, list[dict]]] = {}
+        # (speciality, region, locality) -> doctors, and (speciality, region)
+        # -> the doctors of the region geocoded to the state center only, and
+        # -> every doctor of the region, in rank order
+        self.places: dict[tuple[str, str, str], list[dict]] = {}
+        self.unplaced: dict[tuple[str, str], list[dict]] = {}
+        self.regions: dict[tuple[str, str], list[dict]] = {}
+
+    def add(self, doctor: BaseModel | dict) -> Geocode | None:
+        # The doctor's geocode; None (and the doctor is left out) without a
+        # speciality or a region the gazetteer knows
+        if isinstance(doctor, BaseModel):
+            doctor = doctor.model_dump(mode="json")
+        geocode = None
+        if doctor.get("speciality") and doctor.get("region"):
+            if doctor.get("geocode"):
+                geocode = Geocode.model_validate(doctor["geocode"])
+            elif self.geocoder:
+                geocode = self.geocoder.geocode(doctor.get("locality"), doctor["region"])
+        if geocode:
+            self.doctors[doctor["link"]] = {**doctor, "geocode": geocode.model_dump()}
+        else:
+            self.doctors.pop(doctor["link"], None)
+        return geocode
+
+    def add_all(self, doctors: Iterable[BaseModel | dict]) -> "NearestDoctorIndex":
+        for doctor in doctors:
+            self.add(doctor)
+        return self
+
+    def finalize(self) -> "NearestDoctorIndex":
+        # Builds the trees and place lists from the doctors added so far; call
+        # before nearest() and find()
+        by_speciality: dict[str, list[dict]] = {}
+        self.places, self.unplaced, self.regions = {}, {}, {}
+        for doctor in sorted(self.doctors.values(), key=rank_key):
+            speciality, region, locality = place_key(
+                doctor["speciality"], doctor["region"], doctor.get("locality")
+            )
+            self.places.setdefault((speciality, region, locality), []).append(doctor)
+            self.regions.setdefault((speciality, region), []).append(doctor)
+            if doctor["geocode"]["precision"] == "city":
+                by_speciality.setdefault(speciality, []).append(doctor)
+            else:
+                self.unplaced.setdefault((speciality, region), []).append(doctor)
+        self.trees = {}
+        for speciality, doctors in by_speciality.items():
+            points = unit_vectors(
+                [doctor["geocode"]["lat"] for doctor in doctors],
+                [doctor["geocode"]["lon"] for doctor in doctors],
+            )
+            self.trees[speciality] = (KDTree(points), doctors)
+        return self
+
+    def nearest(self, speciality: str, lat: float, lon: float, k: int = 10) -> list[tuple[dict, float]]:
+        # (doctor, distance in km) pairs, nearest first, of the doctors
+        # geocoded to a city
+        if speciality not in self.trees:
+            return []
+        tree, doctors = self.trees[speciality]
+        return [
+            (doctors[index], chord_to_km(chord))
+            for index, chord in tree.nearest(unit_vectors(lat, lon), k)
+        ]
+
+    def find(
+        self, speciality: str, region: str, locality: str | None, limit: int = 10
+    ) -> list[dict]:
+        # DoctorLocationIndex.find's lookup by place, answered by distance:
+        # the locality's own doctors first, then the nearest ones whichever
+        # state they are in, then the region's doctors whose locality could
+        # not be placed. A locality the gazetteer does not know has no
+        # distances to rank by, so it gets find_doctors_by_location's order.
+        geocode = self.geocoder.geocode(locality, region) if self.geocoder else None
+        if geocode is None:
+            return []
+        key = place_key(speciality, region, locality)
+        ranked = self.places.get(key, [])[:limit]
+        if geocode.precision == "city":
+            candidates = [
+                doctor
+                for doctor, _ in self.nearest(speciality, geocode.lat, geocode.lon, limit + len(ranked))
+            ] + self.unplaced.get(key[:2], [])
+        else:
+            candidates = self.regions.get(key[:2], [])
+        seen = {doctor["link"] for doctor in ranked}
+        for doctor in candidates:
+            if len(ranked) >= limit:
+                break
+            if doctor["link"] not in seen:
+                seen.add(doctor["link"])
+                ranked.append(doctor)
+        return ranked
+
+    def save(self, path: str):
+        # The doctors with their geocodes, so load() needs no gazetteer
+        with open(path, "w") as file:
+            json.dump(list(self.doctors.values()), file)
+
+    @classmethod
+    def load(cls, path: str, geocoder: Gazetteer | GeocodeCache | None = None) -> "NearestDoctorIndex":
+        return cls(geocoder).add_all(iter_json_records(path)).finalize()
+
+
+if __name__ == "__main__":
+    # python geo_index.py build scraped_doctors.json geo_index.json
+    # python geo_index.py nearest geo_index.json "Cardiology" "Toledo" OH [k]
+    command, *rest = sys.argv[1:]
+    if command == "build":
+        source, target = rest[:2]
+        with GeocodeCache("geocodes.json", Gazetteer.load()) as geocodes:
+            index = NearestDoctorIndex(geocodes).add_all(iter_json_records(source))
+        index.save(target)
+        precisions = [doctor["geocode"]["precision"] for doctor in index.doctors.values()]
+        print(
+            f"Geocoded {len(index.doctors)} doctors ({precisions.count('city')} to a city) "
+            f"from {len(geocodes.geocodes)} places, {geocodes.misses} looked up"
+        )
+    elif command == "nearest":
+        path, speciality, locality, region = rest[:4]
+        gazetteer = Gazetteer.load()
+        geocode = gazetteer.geocode(locality, region)
+        if geocode is None:
+            sys.exit(f"Unknown region {region}")
+        index = NearestDoctorIndex.load(path, gazetteer)
+        k = int(rest[4]) if len(rest) > 4 else 10
+        for doctor in index.find(speciality, region, locality, k):
+            place = Geocode.model_validate(doctor["geocode"])
+            # Unknown when either end is only placed at its state's center
+            known = place.precision == geocode.precision == "city"
+            distance = f"{distance_km(place, geocode):8.1f}" if known else f"{'?':>8}"
+            name = f"{doctor.get('first_name')} {doctor.get('last_name')}"
+            print(f"{distance} km  {name}, {doctor.get('locality')} {doctor['region']}")
@@ -0,0 +1,89 @@
+import json
+import os
+import time
+from typing import Iterable, Literal
+
+# "merged": the profile turned out to be a doctor already stored under another link
+Status = Literal["fetched", "parsed", "uploaded", "unchanged", "merged", "failed"]
+
+
+class ProgressJournal:
+    # Append-only JSON Lines log of what a crawl has done with each key (a profile
+    # link or a specialty). Lines are flushed on every write and fsynced at most
+    # every `fsync_interval` seconds; replaying the file on open gives the latest
+    # status per key, so a restarted run can skip work that already finished.
+    def __init__(self, path: str, fsync_interval: float = 2.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.statuses: dict[str, Status] = {}
+        self.reasons: dict[str, str] = {}
+        if os.path.exists(path):
+            self._replay()
+        self.file = open(path, "a")
+        self.last_sync = time.monotonic()
+
+    def _replay(self):
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a torn last line behind
+                    continue
+                self.statuses[entry["key"]] = entry["status"]
+                if entry.get("reason"):
+                    self.reasons[entry["key"]] = entry["reason"]
+                else:
+                    self.reasons.pop(entry["key"], None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, key: str, status: Status, reason: str | None = None):
+        entry = {"key": key, "status": status, "ts": time.time()}
+        if reason:
+            entry["reason"] = reason
+            self.reasons[key] = reason
+        else:
+            self.reasons.pop(key, None)
+        self.statuses[key] = status
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        if time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def fail(self, key: str, reason: str):
+        self.record(key, "failed", reason)
+
+    def status(self, key: str) -> Status | None:
+        return self.statuses.get(key)
+
+    def pending(
+        self,
+        keys: Iterable[str],
+        done: Status | tuple[Status, ...] = ("uploaded", "unchanged", "merged"),
+    ) -> list[str]:
+        # Keys never seen, interrupted part way or failed; failures are retried
+        if isinstance(done, str):
+            done = (done,)
+        return [key for key in keys if self.statuses.get(key) not in done]
+
+    def failures(self) -> dict[str, str]:
+        return {
+            key: self.reasons.get(key, "")
+            for key, status in self.statuses.items()
+            if status == "failed"
+        }
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
@@ -0,0 +1,67 @@
+import json
+from typing import Iterator
+
+CHUNK_SIZE = 1 << 16
+
+
+def _iter_array(file, buffer: str, chunk_size: int) -> Iterator[dict]:
+    decoder = json.JSONDecoder()
+    pos = 1  # past the opening "["
+    eof = False
+
+    while True:
+        # Skip whitespace and separators between records
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+
+        if pos < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+                # A value ending right at the buffer edge may go on in the next chunk
+                if end < len(buffer) or eof:
+                    yield record
+                    pos = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+
+        if eof:
+            raise ValueError("Unterminated JSON array")
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_json_records(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    # Yields the records of a JSON array file or a JSON Lines file one at a time,
+    # holding at most one chunk plus one record in memory
+    with open(path, "r") as file:
+        buffer = file.read(chunk_size).lstrip()
+        if buffer.startswith("["):
+            yield from _iter_array(file, buffer, chunk_size)
+            return
+
+        # JSON Lines: finish the line the first chunk ended in, then go line by line
+        head, _, rest = buffer.rpartition("\n")
+        for line in head.splitlines():
+            if line.strip():
+                yield json.loads(line)
+        rest += file.readline()
+        if rest.strip():
+            yield json.loads(rest)
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_json_lines(records, path: str) -> int:
+    # Writes records as JSON Lines, the cheapest format to stream back in
+    count = 0
+    with open(path, "w") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+            count += 1
+    return count
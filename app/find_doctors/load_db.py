@@ -1,32 +1,74 @@
 import os
-from selenium import webdriver
+import sys
+import time
 from selenium.webdriver.common.by import By
-from supabase import create_client
-import multiprocessing
 from multiprocessing import Pool
-import supabase
+from multiprocessing.util import Finalize
+from pydantic import ValidationError
+from clients import get_supabase_client
+from doctor_index import DoctorLocationIndex
+from driver_pool import ManagedDriver
+from entity_resolution import canonical_link, read_listings
+from geo_index import Gazetteer, GeocodeCache, NearestDoctorIndex
+from json_stream import iter_json_records
+from name_index import NameSearchIndex, split_listing_name
+from journal import ProgressJournal
+from metrics import Metrics
+from models import DoctorFromSite
 
-# Set up Supabase client
-from dotenv import load_dotenv
-load_dotenv("../../.env.local")
 
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
+# Define the number of worker processes (set according to your system capabilities),
+# each one keeps a single headless browser open for all of its doctors
+NUM_WORKERS = 4
 
-# Define the number of worker processes (set according to your system capabilities)
-NUM_WORKERS = 1
+# Pages a browser loads before it is restarted to keep its memory in check
+PAGES_PER_DRIVER = 200
 
-# Define the function to process each doctor's data
+# Progress journal; doctors already saved by an earlier run are skipped
+JOURNAL_PATH = "load_db_progress.jsonl"
+
+# The new_doctors export (see upload_doctors_to_db.py) the lookup indexes are
+# rebuilt from, in a pass of their own so the upload holds one batch at a time
+EXPORT_PATH = "scraped_doctors.json"
+# In-process copy of the find_doctors_by_location lookup, see doctor_index.py
+LOCATION_INDEX_PATH = "doctor_index.json"
+
+# Name search index over every scraped and listed doctor, see name_index.py
+NAME_INDEX_PATH = "name_index.json"
+# Nearest-doctor index by speciality, and the geocodes of every (locality,
+# region) seen so far, so each place is looked up in the gazetteer once
+GEO_INDEX_PATH = "geo_index.json"
+GEOCODE_CACHE_PATH = "geocodes.json"
+
+# Per-stage timings and errors of the run, see metrics.py
+METRICS_PATH = "load_db_metrics.prom"
+
+# Browser owned by the current worker process, set up by init_worker
+managed_driver: ManagedDriver | None = None
+
+
+def init_worker():
+    global managed_driver
+    managed_driver = ManagedDriver(max_pages=PAGES_PER_DRIVER)
+    # Close the browser when the worker exits after pool.close() / pool.join()
+    Finalize(managed_driver, managed_driver.quit, exitpriority=10)
+
+
+# Define the function to process each doctor's data. Runs in a worker process,
+# so the seconds spent per stage are returned with the result rather than
+# recorded here.
 def process_doctor(doctor_info):
     doctor_name, doctor_link = doctor_info
-    # Set up the Selenium WebDriver in each worker process
-    driver = webdriver.Chrome()  # Modify this if needed to point to your driver path
+    timings = {}
+    stage, start = "fetch", time.perf_counter()
 
-    # Visit doctor detail page
-    driver.get(doctor_link)
-    
     try:
+        # Visit doctor detail page
+        driver = managed_driver.get()
+        driver.get(doctor_link)
+        timings[stage] = time.perf_counter() - start
+
+        stage, start = "parse", time.perf_counter()
         city_element = driver.find_element(By.CSS_SELECTOR, 'span[itemprop="addressLocality"]')
         state_element = driver.find_element(By.CSS_SELECTOR, 'span[itemprop="addressRegion"]')
         speciality_element = driver.find_element(By.CSS_SELECTOR, 'a.profile-head-subtitle')
@@ -50,48 +92,108 @@ def process_doctor(doctor_info):
 
         # Combine subspecialty and job title
         combined_text = f"{subspecialty_text}, {job_title_text}" if subspecialty_text and job_title_text else subspecialty_text or job_title_text
+        timings[stage] = time.perf_counter() - start
 
         # Save the data to Supabase
-        supabase_client.table('doctors').insert({
+        stage, start = "write", time.perf_counter()
+        get_supabase_client().table('doctors').insert({
             'name': doctor_name,
             'city': city_element.text,
             'state': state_element.text,
             'specialty': speciality_element.text,
             'bio': combined_text
         }).execute()
-    finally:
-        driver.quit()
-
-# Define a function to parse a file and return doctor data
-def parse_file(file_path):
-    doctor_data = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            if line.strip():
-                parts = line.split(' ')
-                doctor_name = " ".join(parts[:-1])
-                doctor_link = parts[-1]
-                doctor_data.append((doctor_name, doctor_link))
-    return doctor_data
-
-# Function to process all files and prepare doctor data for multiprocessing
-def process_files_in_directory(files_directory):
-    all_doctor_data = []
-    for filename in os.listdir(files_directory):
-        file_path = os.path.join(files_directory, filename)
-        all_doctor_data.extend(parse_file(file_path))
-    return all_doctor_data
+        timings[stage] = time.perf_counter() - start
+        return doctor_link, None, timings
+    except Exception as e:
+        timings[stage] = time.perf_counter() - start
+        return doctor_link, (stage, type(e).__name__, str(e)), timings
+
+def build_indexes(export_path: str, listings: list[tuple[str, str]] = ()):
+    # Streams the export into the lookup indexes, reading each record the way
+    # upload_doctors_to_db.py does so they hold the rows it upserts. Listed
+    # doctors (name, link) the export has no name for are searched by their
+    # listing name.
+    locations = DoctorLocationIndex()
+    names = NameSearchIndex()
+    invalid = 0
+    with GeocodeCache(GEOCODE_CACHE_PATH, Gazetteer.load()) as geocodes:
+        nearest = NearestDoctorIndex(geocodes)
+        for record in iter_json_records(export_path) if os.path.exists(export_path) else ():
+            if isinstance(record.get("link"), str):
+                record["link"] = canonical_link(record["link"])
+            try:
+                doctor = DoctorFromSite.model_validate(record)
+            except ValidationError:
+                invalid += 1
+                continue
+            if not doctor.model_dump(exclude={"link"}, exclude_none=True):
+                # Seed rows are not uploaded either
+                continue
+            locations.add(doctor)
+            if doctor.first_name or doctor.last_name:
+                names.add(str(doctor.link), doctor.first_name, doctor.last_name, doctor.region)
+            nearest.add(doctor)
+    for doctor_name, doctor_link in listings:
+        if doctor_link not in names.entries:
+            names.add(doctor_link, *split_listing_name(doctor_name))
+    locations.save(LOCATION_INDEX_PATH)
+    names.save(NAME_INDEX_PATH)
+    nearest.save(GEO_INDEX_PATH)
+    cities = sum(doctor["geocode"]["precision"] == "city" for doctor in nearest.doctors.values())
+    print(
+        f"Indexed {len(locations.doctors)} doctors by location, {len(names.entries)} by name "
+        f"and {len(nearest.doctors)} by distance ({cities} placed in a city, "
+        f"{geocodes.misses} places looked up), {invalid} invalid records skipped"
+    )
+
 
 # Main function to handle multiprocessing
 def main():
     files_directory = "doc_dir"  # Set this to the folder where your files are located
     
-    # Collect all doctor data from the files
-    doctor_data = process_files_in_directory(files_directory)
+    # Collect all doctor data from the files, one entry per profile however many
+    # listings and link variants it appears under
+    doctor_data = [(doctor.name, str(doctor.link)) for doctor in read_listings(files_directory)]
+
+    build_indexes(EXPORT_PATH, doctor_data)
+
+    with ProgressJournal(JOURNAL_PATH) as journal:
+        pending = set(journal.pending(link for _, link in doctor_data))
+        doctor_data = [doctor for doctor in doctor_data if doctor[1] in pending]
+
+        # Use a pool of workers to process each doctor in parallel
+        metrics = Metrics("load_db")
+        pool = Pool(NUM_WORKERS, initializer=init_worker)
+        try:
+            for doctor_link, error, timings in pool.imap_unordered(process_doctor, doctor_data):
+                for stage, seconds in timings.items():
+                    metrics.observe(stage, seconds)
+                if error:
+                    stage, category, message = error
+                    metrics.error(stage, category)
+                    journal.fail(doctor_link, message)
+                else:
+                    metrics.count("write")
+                    journal.record(doctor_link, "uploaded")
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            metrics.write(METRICS_PATH)
 
-    # Use a pool of workers to process each doctor in parallel
-    with Pool(NUM_WORKERS) as pool:
-        pool.map(process_doctor, doctor_data)
+    print(metrics.summary())
 
 if __name__ == "__main__":
-    main()
+    # python load_db.py                    ingest doc_dir and rebuild the indexes
+    # python load_db.py indexes [export]   only rebuild the indexes
+    if sys.argv[1:2] == ["indexes"]:
+        listings = read_listings("doc_dir") if os.path.isdir("doc_dir") else []
+        build_indexes(
+            sys.argv[2] if len(sys.argv) > 2 else EXPORT_PATH,
+            [(doctor.name, str(doctor.link)) for doctor in listings],
+        )
+    else:
+        main()
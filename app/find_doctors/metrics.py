@@ -0,0 +1,183 @@
+import bisect
+import json
+import math
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds: the Prometheus client defaults, plus sub-millisecond
+# buckets for in-process stages (validation, parsing) and room for minute-long
+# browser page loads and API retries
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the overflow (+Inf) bucket, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        # Interpolated linearly within the bucket holding the q-th observation,
+        # like Prometheus' histogram_quantile, with the bucket narrowed to the
+        # smallest and largest values seen: the lowest bucket has no lower
+        # bound of its own, and interpolating from 0 overstates fast stages
+        if not self.count:
+            return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            if count and seen + count >= rank:
+                low, high = max(lower, self.min), min(bound, self.max)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+
+class Metrics:
+    # Per-run instrumentation shared by the scraping and loading scripts:
+    # latency histograms per stage (fetch, parse, classify, embed, write, ...),
+    # error counts by stage and category, retries per stage, items per stage
+    # and the current and peak depth of each queue. Written once at the end of
+    # a run as Prometheus text or, for a .json path, JSON.
+    def __init__(self, job: str):
+        self.job = job
+        self.started = time.time()
+        self.latencies: dict[str, Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.retries: dict[str, int] = {}
+        self.items: dict[str, int] = {}
+        self.depths: dict[str, int] = {}
+        self.peak_depths: dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float):
+        self.latencies.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        # Times the block as one unit of `stage`; an exception escaping it is
+        # counted under its class name and re-raised
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(stage, type(e).__name__)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def error(self, stage: str, category: str):
+        self.errors[(stage, category)] = self.errors.get((stage, category), 0) + 1
+
+    def retry(self, stage: str, count: int = 1):
+        self.retries[stage] = self.retries.get(stage, 0) + count
+
+    def count(self, stage: str, items: int = 1):
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def queue_depth(self, queue: str, depth: int):
+        self.depths[queue] = depth
+        self.peak_depths[queue] = max(self.peak_depths.get(queue, 0), depth)
+
+    def to_json(self) -> dict:
+        return {
+            "job": self.job,
+            "started": self.started,
+            "elapsed": time.time() - self.started,
+            "latency_seconds": {
+                stage: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "max": histogram.max,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": dict(zip([*map(str, histogram.buckets), "+Inf"], histogram.counts)),
+                }
+                for stage, histogram in self.latencies.items()
+            },
+            "errors": [
+                {"stage": stage, "category": category, "count": count}
+                for (stage, category), count in self.errors.items()
+            ],
+            "retries": self.retries,
+            "items": self.items,
+            "queue_depth": self.depths,
+            "queue_depth_max": self.peak_depths,
+        }
+
+    def to_prometheus(self) -> str:
+        job = _label(self.job)
+        lines = [
+            "# HELP aria_stage_seconds Time spent on one unit of work of a stage",
+            "# TYPE aria_stage_seconds histogram",
+        ]
+        for stage, histogram in self.latencies.items():
+            labels = f'job="{job}",stage="{_label(stage)}"'
+            cumulative = 0
+            for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f'aria_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"aria_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"aria_stage_seconds_count{{{labels}}} {histogram.count}")
+        lines += ["# HELP aria_errors_total Errors by stage and category", "# TYPE aria_errors_total counter"]
+        for (stage, category), count in self.errors.items():
+            lines.append(
+                f'aria_errors_total{{job="{job}",stage="{_label(stage)}",category="{_label(category)}"}} {count}'
+            )
+        lines += ["# HELP aria_retries_total Retried attempts by stage", "# TYPE aria_retries_total counter"]
+        for stage, count in self.retries.items():
+            lines.append(f'aria_retries_total{{job="{job}",stage="{_label(stage)}"}} {count}')
+        lines += ["# HELP aria_items_total Items handled by stage", "# TYPE aria_items_total counter"]
+        for stage, count in self.items.items():
+            lines.append(f'aria_items_total{{job="{job}",stage="{_label(stage)}"}} {count}')
+        lines += ["# HELP aria_queue_depth Items waiting in a queue", "# TYPE aria_queue_depth gauge"]
+        for queue, depth in self.depths.items():
+            lines.append(f'aria_queue_depth{{job="{job}",queue="{_label(queue)}"}} {depth}')
+        lines += ["# HELP aria_queue_depth_max Peak items waiting in a queue", "# TYPE aria_queue_depth_max gauge"]
+        for queue, depth in self.peak_depths.items():
+            lines.append(f'aria_queue_depth_max{{job="{job}",queue="{_label(queue)}"}} {depth}')
+        lines += [
+            "# HELP aria_run_seconds Wall time of the run so far",
+            "# TYPE aria_run_seconds gauge",
+            f'aria_run_seconds{{job="{job}"}} {time.time() - self.started}',
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        with open(path, "w") as file:
+            if path.endswith(".json"):
+                json.dump(self.to_json(), file, indent=2)
+            else:
+                file.write(self.to_prometheus())
+
+    def summary(self) -> str:
+        # Where the run spent its time, for printing at the end
+        lines = [f"{self.job}: {time.time() - self.started:.1f}s"]
+        for stage, histogram in sorted(self.latencies.items(), key=lambda item: -item[1].sum):
+            lines.append(
+                f"  {stage:<10} {histogram.count:>8} x  total {histogram.sum:9.1f}s  "
+                f"mean {histogram.sum / histogram.count:.3f}s  p99 ~{histogram.quantile(0.99):.3f}s  "
+                f"retries {self.retries.get(stage, 0)}"
+            )
+        for (stage, category), count in sorted(self.errors.items()):
+            lines.append(f"  error {stage}/{category}: {count}")
+        for queue, depth in self.peak_depths.items():
+            lines.append(f"  queue {queue}: peak {depth}")
+        return "\n".join(lines)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, HttpUrl
+
+
+class DoctorFromFile(BaseModel):
+    name: str
+    link: HttpUrl
+    # Every doctors_<specialty>.txt listing the profile appeared in
+    specialties: list[str] = []
+
+
+class DoctorFromSite(BaseModel):
+    first_name: str | None = None
+    last_name: str | None = None
+    credentials: str | None = None
+    link: HttpUrl
+    locality: str | None = None
+    locality_url: HttpUrl | None = None
+    region: str | None = None
+    region_url: HttpUrl | None = None
+    speciality: str | None = None
+    speciality_link: HttpUrl | None = None
+    photo_url: HttpUrl | None = None
+    specialties: list[str] | None = None
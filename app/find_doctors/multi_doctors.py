@@ -1,17 +1,42 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import os
-import supabase
-from dotenv import load_dotenv
+import asyncio
 from multiprocessing import Pool
+from directory_crawler import (
+    CONCURRENCY,
+    INITIAL_CONCURRENCY,
+    LATENCY_TARGET,
+    PER_HOST_RATE,
+    crawl_specialties,
+)
+from fetcher import ProfileFetcher
+from journal import ProgressJournal
+from metrics import Metrics
+from rate_control import AdaptiveLimiter
 
+# Progress journal; specialties whose listing was already saved are skipped
+JOURNAL_PATH = "multi_doctors_progress.jsonl"
 
-# Function to scrape a single specialty
+# Directory pages are fetched over plain HTTP; set this to fall back to one
+# Selenium browser per specialty
+USE_SELENIUM = False
+
+METRICS_PATH = "multi_doctors_metrics.prom"
+metrics = Metrics("multi_doctors")
+
+
+def save_specialty(specialty_name, all_doctors):
+    # Save results to a text file (one for each specialty)
+    with open(f'doctors_{specialty_name}.txt', 'w') as file:
+        for doctor in all_doctors:
+            file.write(f"{doctor}\n")
+
+
+# Function to scrape a single specialty with a browser
 def scrape_specialty(specialty):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    from selenium.webdriver.common.by import By
+
     driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
     
     specialty_name, specialty_url = specialty
@@ -35,17 +60,35 @@ def scrape_specialty(specialty):
 
     driver.quit()
 
-    # Save results to a text file (one for each specialty)
-    with open(f'doctors_{specialty_name}.txt', 'w') as file:
-        for doctor in all_doctors:
-            file.write(f"{doctor}\n")
+    save_specialty(specialty_name, all_doctors)
+
 
+async def crawl_specialties_over_http(specialties, journal):
+    limiter = AdaptiveLimiter(
+        "fetch",
+        initial=INITIAL_CONCURRENCY,
+        maximum=CONCURRENCY,
+        latency_target=LATENCY_TARGET,
+        metrics=metrics,
+    )
+    async with ProfileFetcher(
+        concurrency=CONCURRENCY, per_host_rate=PER_HOST_RATE, metrics=metrics, limiter=limiter
+    ) as fetcher:
+        async for specialty_name, result in crawl_specialties(fetcher, specialties):
+            if isinstance(result, Exception):
+                metrics.error("crawl", type(result).__name__)
+                journal.fail(specialty_name, str(result))
+                continue
+            try:
+                save_specialty(specialty_name, result)
+            except OSError as e:
+                metrics.error("save", type(e).__name__)
+                journal.fail(specialty_name, str(e))
+                continue
+            metrics.count("crawl")
+            metrics.count("doctors", len(result))
+            journal.record(specialty_name, "fetched")
 
-# Load environment variables
-load_dotenv("../../.env.local")
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
 
 # List of specialties and their URLs
 specialties_urls = [
@@ -108,7 +151,28 @@ specialties_urls = [
     ["Vascular Surgery", "https://www.doximity.com/directory/md/specialty/vascular-surgery"]
 ]
 
-# Use multiprocessing to scrape all specialties in parallel
 if __name__ == "__main__":
-    with Pool(processes=len(specialties_urls)) as pool:
-        pool.map(scrape_specialty, specialties_urls)
\ No newline at end of file
+    with ProgressJournal(JOURNAL_PATH) as journal:
+        pending = set(journal.pending((name for name, _ in specialties_urls), done="fetched"))
+        specialties = [specialty for specialty in specialties_urls if specialty[0] in pending]
+
+        if not USE_SELENIUM:
+            asyncio.run(crawl_specialties_over_http(specialties, journal))
+        else:
+            # Use multiprocessing to scrape all specialties in parallel
+            with Pool(processes=max(len(specialties), 1)) as pool:
+                results = [
+                    (specialty[0], pool.apply_async(scrape_specialty, (specialty,)))
+                    for specialty in specialties
+                ]
+                for specialty_name, result in results:
+                    try:
+                        result.get()
+                        metrics.count("crawl")
+                        journal.record(specialty_name, "fetched")
+                    except Exception as e:
+                        metrics.error("crawl", type(e).__name__)
+                        journal.fail(specialty_name, str(e))
+
+        metrics.write(METRICS_PATH)
+        print(metrics.summary())
@@ -0,0 +1,233 @@
+import bisect
+import json
+import random
+import re
+import sys
+import time
+import unicodedata
+from typing import Iterable
+
+import numpy as np
+from pydantic import BaseModel
+
+from json_stream import iter_json_records
+
+# Below this trigram similarity a fuzzy match is not returned; the default of
+# pg_trgm's similarity_threshold, which search_physicians relies on
+MIN_SIMILARITY = 0.3
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_name(text: str | None) -> str:
+    # Lower case ASCII words, the same folding applied to names and queries
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return " ".join(WORD.findall(text.lower()))
+
+
+def trigrams(text: str) -> set[str]:
+    # pg_trgm's trigrams: every word padded with two spaces in front and one behind
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def split_listing_name(name: str) -> tuple[str, str]:
+    # "A. Michael Lincoff, MD" -> ("A. Michael", "Lincoff")
+    first, _, last = name.split(",", 1)[0].strip().rpartition(" ")
+    return first, last
+
+
+class NameEntry(BaseModel):
+    link: str
+    first_name: str | None = None
+    last_name: str | None = None
+    region: str | None = None
+
+
+class NameSearchIndex:
+    # Doctor name lookup for search-as-you-type. Every query word must be a
+    # prefix of a word of the name (answered by binary search over the sorted
+    # name words); when that finds fewer than `limit` doctors, trigram
+    # similarity fills up the rest, so "jonh smth" still finds John Smith.
+    def __init__(self):
+        self.entries: dict[str, NameEntry] = {}
+
+    def add(
+        self,
+        link: str,
+        first_name: str | None,
+        last_name: str | None,
+        region: str | None = None,
+    ):
+        if not normalize_name(f"{first_name or ''} {last_name or ''}"):
+            # Nothing to search by; the latest record of a link wins
+            self.entries.pop(link, None)
+            return
+        self.entries[link] = NameEntry(
+            link=link, first_name=first_name, last_name=last_name, region=region
+        )
+
+    def add_all(self, doctors: Iterable[BaseModel | dict]) -> "NameSearchIndex":
+        for doctor in doctors:
+            if isinstance(doctor, BaseModel):
+                doctor = doctor.model_dump(mode="json")
+            self.add(doctor["link"], doctor.get("first_name"), doctor.get("last_name"), doctor.get("region"))
+        return self
+
+    def finalize(self) -> "NameSearchIndex":
+        # Builds the lookup structures; call after the last add() and before search()
+        self.rows = sorted(
+            self.entries.values(),
+            key=lambda e: (e.last_name or "", e.first_name or "", e.link),
+        )
+        self.names = [normalize_name(f"{e.first_name or ''} {e.last_name or ''}") for e in self.rows]
+        self.regions = np.array([e.region or "" for e in self.rows])
+
+        words = sorted(
+            (word, row) for row, name in enumerate(self.names) for word in set(name.split())
+        )
+        self.words = [word for word, _ in words]
+        self.word_rows = np.array([row for _, row in words], dtype=np.int32)
+
+        postings: dict[str, list[int]] = {}
+        self.gram_counts = np.zeros(len(self.rows), dtype=np.int32)
+        for row, name in enumerate(self.names):
+            grams = trigrams(name)
+            self.gram_counts[row] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+        return self
+
+    def _prefix_rows(self, word: str) -> np.ndarray:
+        start = bisect.bisect_left(self.words, word)
+        end = bisect.bisect_left(self.words, word + "\x7f", start)
+        return self.word_rows[start:end]
+
+    def search(
+        self,
+        query: str,
+        region: str | None = None,
+        limit: int = 20,
+        min_similarity: float = MIN_SIMILARITY,
+    ) -> list[NameEntry]:
+        query = normalize_name(query)
+        if not query or not self.rows:
+            return []
+        allowed = None if not region else self.regions == region
+
+        rows = None
+        for word in query.split():
+            matches = np.unique(self._prefix_rows(word))
+            rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        # Rows are in name order, so prefix matches come back alphabetically
+        ranked = list(rows[:limit])
+
+        if len(ranked) < limit:
+            grams = trigrams(query)
+            hits = [self.postings[gram] for gram in grams if gram in self.postings]
+            if hits:
+                shared = np.bincount(np.concatenate(hits), minlength=len(self.rows))
+                similarity = shared / (len(grams) + self.gram_counts - shared)
+                candidates = similarity >= min_similarity
+                if allowed is not None:
+                    candidates &= allowed
+                candidates[rows] = False
+                fuzzy = np.flatnonzero(candidates)
+                fuzzy = fuzzy[np.argsort(-similarity[fuzzy], kind="stable")]
+                ranked.extend(fuzzy[: limit - len(ranked)])
+        return [self.rows[row] for row in ranked]
+
+    def save(self, path: str):
+        with open(path, "w") as file:
+            json.dump([entry.model_dump() for entry in self.entries.values()], file)
+
+    @classmethod
+    def load(cls, path: str) -> "NameSearchIndex":
+        return cls().add_all(iter_json_records(path)).finalize()
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+def benchmark(index: NameSearchIndex, queries: int = 1000, seed: int = 0):
+    # Latency of prefix and misspelled lookups against a linear substring scan
+    # (what first_name/last_name ilike '%q%' does), and how often a misspelled
+    # full name still finds its doctor, or a namesake, in the top 10
+    rng = random.Random(seed)
+    targets = [rng.randrange(len(index.rows)) for _ in range(queries)]
+    prefixes = [index.names[row][: rng.randint(2, 6)] for row in targets]
+    # One transposed pair of letters in the last name
+    typos = [
+        " ".join(index.names[row].split()[:-1] + [_typo(index.names[row].split()[-1], rng)])
+        for row in targets
+    ]
+
+    def timed(function, inputs):
+        latencies, results = [], []
+        for query in inputs:
+            start = time.perf_counter()
+            results.append(function(query))
+            latencies.append(time.perf_counter() - start)
+        return results, np.array(latencies) * 1e6
+
+    def scan(query):
+        return [row for row, name in enumerate(index.names) if query in name][:20]
+
+    for label, function, inputs in [
+        ("linear scan, prefix", scan, prefixes),
+        ("index, prefix", index.search, prefixes),
+        ("index, misspelled", lambda q: index.search(q, limit=10), typos),
+    ]:
+        results, latencies = timed(function, inputs)
+        print(
+            f"{label:<22} p50 {np.percentile(latencies, 50):8.1f} us  "
+            f"p99 {np.percentile(latencies, 99):8.1f} us"
+        )
+        if label == "index, misspelled":
+            found = np.mean(
+                [
+                    index.names[row]
+                    in {normalize_name(f"{e.first_name or ''} {e.last_name or ''}") for e in result}
+                    for row, result in zip(targets, results)
+                ]
+            )
+            print(f"misspelled names found in top 10: {found:.3f}")
+
+
+if __name__ == "__main__":
+    # python name_index.py export scraped_doctors.json name_index.json
+    # python name_index.py bench scraped_doctors.json [doc_dir]
+    command, source, *rest = sys.argv[1:]
+    index = NameSearchIndex().add_all(iter_json_records(source))
+    if command == "export":
+        index.save(rest[0])
+        print(f"Indexed {len(index.entries)} doctor names")
+    elif command == "bench":
+        if rest:
+            # Profiles scraped without names are searched by their listing name
+            from entity_resolution import canonical_link, read_listings
+
+            listed = {str(d.link): d.name for d in read_listings(rest[0])}
+            for record in iter_json_records(source):
+                name = listed.get(canonical_link(record["link"]))
+                if not (record.get("first_name") or record.get("last_name")) and name:
+                    index.add(record["link"], *split_listing_name(name), record.get("region"))
+        index.finalize()
+        if not index.rows:
+            # The seed export holds links only; its names are in the listings
+            sys.exit(
+                f"No doctor names in {source}; pass the listings directory: "
+                f"python name_index.py bench {source} doc_dir"
+            )
+        print(f"{len(index.rows)} doctors, {len(index.postings)} trigrams")
+        benchmark(index)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from pydantic import BaseModel
+
+
+class CachedProfile(BaseModel):
+    link: str
+    etag: str | None = None
+    last_modified: str | None = None
+    fields_hash: str | None = None
+
+
+def hash_fields(fields: BaseModel | dict) -> str:
+    if isinstance(fields, BaseModel):
+        fields = fields.model_dump(mode="json")
+    payload = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ProfileCache:
+    # SQLite store of the HTTP validators (ETag / Last-Modified) and a hash of the
+    # parsed fields for every profile link, so a re-crawl can ask the server for
+    # changed pages only and skip the DB write when the parsed fields match.
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            create table if not exists profiles (
+                link text primary key,
+                etag text,
+                last_modified text,
+                fields_hash text,
+                checked_at real
+            )
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, link: str) -> CachedProfile | None:
+        row = self.connection.execute(
+            "select link, etag, last_modified, fields_hash from profiles where link = ?",
+            (link,),
+        ).fetchone()
+        if row is None:
+            return None
+        return CachedProfile(
+            link=row[0], etag=row[1], last_modified=row[2], fields_hash=row[3]
+        )
+
+    def conditional_headers(self, link: str) -> dict[str, str]:
+        cached = self.get(link)
+        headers = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def put(self, profiles: list[CachedProfile]):
+        now = time.time()
+        self.connection.executemany(
+            """
+            insert into profiles (link, etag, last_modified, fields_hash, checked_at)
+            values (?, ?, ?, ?, ?)
+            on conflict (link) do update set
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                fields_hash = excluded.fields_hash,
+                checked_at = excluded.checked_at
+            """,
+            [
+                (p.link, p.etag, p.last_modified, p.fields_hash, now)
+                for p in profiles
+            ],
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def touch(self, link: str):
+        self.connection.execute(
+            "update profiles set checked_at = ? where link = ?", (time.time(), link)
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
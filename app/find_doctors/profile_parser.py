@@ -0,0 +1,164 @@
+from typing import Literal
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+Backend = Literal["lxml", "bs4"]
+
+BASE_URL = "https://www.doximity.com{relative_link}"
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Every element the profile parser reads, matched in one document-order pass
+PROFILE_XPATH = " | ".join(
+    [
+        f"//span[{_has_class('user-name-first')}]",
+        f"//span[{_has_class('user-name-last')}]",
+        f"//span[{_has_class('user-name-credentials')}]",
+        f"//a[{_has_class('profile-head-subtitle')}]",
+        "//span[@itemprop='addressLocality']",
+        "//span[@itemprop='addressRegion']",
+        f"//div[{_has_class('profile-photo')}]",
+    ]
+)
+
+
+SPAN_CLASSES = [
+    ("user-name-first", "first_name"),
+    ("user-name-last", "last_name"),
+    ("user-name-credentials", "credentials"),
+]
+SPAN_ITEMPROPS = [("addressLocality", "locality"), ("addressRegion", "region")]
+
+
+def to_ascii(value: str) -> str:
+    # Same result as dropping every character with ord(char) >= 128, but done by
+    # the codec in C instead of a Python loop per character
+    return value.encode("ascii", "ignore").decode("ascii").strip()
+
+
+def normalize_fields(fields: dict) -> dict:
+    # Remove unicode characters from non-link values
+    for key, value in fields.items():
+        if (
+            isinstance(value, str)
+            and not key.endswith("_url")
+            and not key.endswith("_link")
+        ):
+            fields[key] = to_ascii(value)
+    return fields
+
+
+def _extract_lxml(html: str) -> dict:
+    tree = lxml.html.fromstring(html)
+    fields = {}
+    seen = set()
+
+    for elem in tree.xpath(PROFILE_XPATH):
+        classes = (elem.get("class") or "").split()
+        itemprop = elem.get("itemprop")
+        keys = []
+        if elem.tag == "span":
+            keys += [key for name, key in SPAN_CLASSES if name in classes]
+            keys += [key for name, key in SPAN_ITEMPROPS if name == itemprop]
+        elif elem.tag == "a":
+            keys.append("speciality")
+        else:
+            keys.append("photo_url")
+
+        for key in keys:
+            # Only the first match of each field counts, like soup.find
+            if key in seen:
+                continue
+            seen.add(key)
+
+            if key == "photo_url":
+                img = elem.find(".//img")
+                if img is not None:
+                    fields["photo_url"] = img.get("src")
+                continue
+
+            fields[key] = elem.text_content().strip()
+            if key == "speciality":
+                fields["speciality_link"] = BASE_URL.format(
+                    relative_link=elem.get("href")
+                )
+            elif key in ("locality", "region"):
+                link = elem.find(".//a")
+                if link is not None:
+                    fields[f"{key}_url"] = BASE_URL.format(
+                        relative_link=link.get("href")
+                    )
+
+    return fields
+
+
+def _extract_bs4(html: str) -> dict:
+    soup = BeautifulSoup(html, "html.parser")
+    fields = {}
+
+    first_name_elem = soup.find("span", class_="user-name-first")
+    if first_name_elem:
+        fields["first_name"] = first_name_elem.text.strip()
+
+    last_name_elem = soup.find("span", class_="user-name-last")
+    if last_name_elem:
+        fields["last_name"] = last_name_elem.text.strip()
+
+    credentials_elem = soup.find("span", class_="user-name-credentials")
+    if credentials_elem:
+        fields["credentials"] = credentials_elem.text.strip()
+
+    speciality_elem = soup.find("a", class_="profile-head-subtitle")
+    if speciality_elem:
+        fields["speciality"] = speciality_elem.text.strip()
+        fields["speciality_link"] = BASE_URL.format(
+            relative_link=speciality_elem.get("href")
+        )
+
+    locality_elem = soup.find("span", attrs={"itemprop": "addressLocality"})
+    if locality_elem:
+        fields["locality"] = locality_elem.text.strip()
+        locality_link_elem = locality_elem.find("a")
+        if locality_link_elem:
+            fields["locality_url"] = BASE_URL.format(
+                relative_link=locality_link_elem.get("href")
+            )
+
+    region_elem = soup.find("span", attrs={"itemprop": "addressRegion"})
+    if region_elem:
+        fields["region"] = region_elem.text.strip()
+        region_link_elem = region_elem.find("a")
+        if region_link_elem:
+            fields["region_url"] = BASE_URL.format(
+                relative_link=region_link_elem.get("href")
+            )
+
+    photo_elem = soup.find("div", class_="profile-photo")
+    if photo_elem:
+        photo_link_elem = photo_elem.find("img")
+        if photo_link_elem:
+            fields["photo_url"] = photo_link_elem.get("src")
+
+    return fields
+
+
+def extract_profile_fields(html: str, backend: Backend = "lxml") -> dict:
+    # DoctorFromSite fields (except link) found on a profile page, before
+    # normalize_fields. The lxml backend walks the document once; bs4 is the
+    # reference implementation and the fallback when lxml is missing or cannot
+    # parse the page.
+    if backend == "lxml" and lxml is not None:
+        try:
+            return _extract_lxml(html)
+        except (etree.ParserError, ValueError):
+            pass
+    return _extract_bs4(html)
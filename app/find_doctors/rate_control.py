@@ -0,0 +1,200 @@
+import asyncio
+import email.utils
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Mapping
+
+# Errors raised when the server never answered: the request timed out or the
+# connection dropped. The OpenAI client raises its own, APITimeoutError being
+# a subclass of APIConnectionError.
+try:
+    from openai import APIConnectionError
+
+    NO_RESPONSE_ERRORS = (TimeoutError, ConnectionError, APIConnectionError)
+except ImportError:
+    NO_RESPONSE_ERRORS = (TimeoutError, ConnectionError)
+
+
+def retry_after(headers: Mapping[str, str] | None) -> float | None:
+    # Seconds a 429/503 response asks the client to wait: Retry-After-Ms,
+    # Retry-After in seconds, or Retry-After as an HTTP date. None when there
+    # is no such header or it does not parse; a server's bad header must not
+    # stop the crawl.
+    if not headers:
+        return None
+    headers = {key.lower(): value for key, value in headers.items()}
+    for key, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            seconds = float(headers[key]) / scale
+        except (KeyError, TypeError, ValueError, OverflowError):
+            continue
+        if math.isfinite(seconds):
+            return max(0.0, seconds)
+    try:
+        date = email.utils.parsedate_to_datetime(headers["retry-after"])
+        return max(0.0, date.timestamp() - time.time())
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+
+
+class TokenBucket:
+    # Allows `per_minute` units a minute, refilled continuously, in bursts of
+    # at most a minute's worth
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        # Seconds until `amount` is available; a request larger than the
+        # whole budget waits for a full bucket rather than forever
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+class Request:
+    # Handed out by AdaptiveLimiter.request(); the caller marks a response the
+    # server pushed back with. An exception carrying a status_code (an HTTP
+    # client error) is marked from that status.
+    def __init__(self):
+        self.outcome = "ok"
+        self.retry_after: float | None = None
+
+    def throttled(self, retry_after: float | None = None):
+        # 429: over the account's or the server's rate limit
+        self.outcome = "throttled"
+        self.retry_after = retry_after
+
+    def overloaded(self, retry_after: float | None = None):
+        # 5xx, timeouts and dropped connections
+        self.outcome = "overloaded"
+        self.retry_after = retry_after
+
+    def failed(self, error: Exception):
+        status = getattr(error, "status_code", None)
+        response = getattr(error, "response", None)
+        wait = retry_after(getattr(response, "headers", None))
+        if status == 429:
+            self.throttled(wait)
+        elif (status is not None and status >= 500) or isinstance(error, NO_RESPONSE_ERRORS):
+            self.overloaded(wait)
+        elif self.outcome == "ok":
+            # Anything else (a bad request, an answer that does not parse)
+            # says nothing about the server's load
+            self.outcome = "failed"
+
+
+class AdaptiveLimiter:
+    # Shared limit on the requests a pipeline has in flight against one
+    # service, adjusted AIMD-style like TCP congestion control: every request
+    # that succeeds (within `latency_target`, if set) raises the limit by
+    # 1/limit, so by one per limit's worth of requests; a 429, a 5xx, a timeout
+    # or a slow answer multiplies it by `decrease`, once per round trip. A
+    # Retry-After pauses every request until it has passed. Request and token
+    # budgets per minute, the account's rate limits, hold across everything
+    # sharing the limiter.
+    #
+    #   async with limiter.request(tokens=n) as request:
+    #       response = await call()
+    #       if response.status == 429:
+    #           request.throttled(retry_after(response.headers))
+    def __init__(
+        self,
+        name: str,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        latency_target: float | None = None,
+        decrease: float = 0.5,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        metrics=None,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # Optional metrics.Metrics: requests in flight, throttled and
+        # overloaded responses and limit cuts
+        self.metrics = metrics
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    def _delay(self, tokens: float) -> float:
+        # Seconds before a request may start; inf while every slot is taken
+        if self.in_flight >= max(self.minimum, int(self.limit)):
+            return math.inf
+        delay = self.paused_until - time.monotonic()
+        if self.requests:
+            delay = max(delay, self.requests.delay(1))
+        if self.tokens and tokens:
+            delay = max(delay, self.tokens.delay(tokens))
+        return max(0.0, delay)
+
+    async def acquire(self, tokens: float = 0):
+        async with self.condition:
+            while (delay := self._delay(tokens)) > 0:
+                try:
+                    await asyncio.wait_for(
+                        self.condition.wait(), None if delay == math.inf else delay
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens and tokens:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            if self.metrics:
+                self.metrics.queue_depth(f"{self.name}_in_flight", self.in_flight)
+
+    async def release(self, request: Request, started: float):
+        now = time.monotonic()
+        slow = self.latency_target is not None and now - started > self.latency_target
+        async with self.condition:
+            self.in_flight -= 1
+            if request.outcome in ("throttled", "overloaded") or slow:
+                if self.metrics:
+                    self.metrics.count(f"{self.name}_{'slow' if request.outcome == 'ok' else request.outcome}")
+                # Requests sent before the last cut report the same congestion
+                # that caused it; only the first of a round trip cuts again
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.last_decrease = now
+                if request.retry_after:
+                    self.paused_until = max(self.paused_until, now + request.retry_after)
+            elif request.outcome == "ok":
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            # Wake only as many waiters as may start, not every one of them
+            self.condition.notify(max(1, int(self.limit) - self.in_flight))
+
+    @asynccontextmanager
+    async def request(self, tokens: float = 0):
+        await self.acquire(tokens)
+        request = Request()
+        started = time.monotonic()
+        try:
+            yield request
+        except Exception as e:
+            request.failed(e)
+            raise
+        finally:
+            await self.release(request, started)
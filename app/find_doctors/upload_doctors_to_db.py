@@ -1,28 +1,61 @@
-import json
-import multiprocessing as mp
+import asyncio
+import sys
+from pydantic import ValidationError
 from tqdm import tqdm
-from supabase import create_client
-from dotenv import load_dotenv
-import os
+from clients import get_supabase_client
+from entity_resolution import canonical_link
+from json_stream import iter_json_records
+from metrics import Metrics
+from models import DoctorFromSite
+from writer import BatchWriter
 
-load_dotenv("../../.env.local")
+# Rows per upsert; reading pauses while a full batch is being written, so the
+# upload never buffers more than one batch however large the export grows
+BATCH_SIZE = 500
 
-supabase = create_client(
-    os.getenv("NEXT_PUBLIC_SUPABASE_URL"), os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
-)
+# The lookup indexes over the export are rebuilt by load_db.py in a pass of
+# their own: python load_db.py indexes scraped_doctors.json
+
+METRICS_PATH = "upload_doctors_metrics.prom"
+metrics = Metrics("upload_doctors")
+
+
+async def upload_doctors(path: str):
+    invalid = 0
+    seeds = 0
+    async with BatchWriter(
+        get_supabase_client(),
+        "new_doctors",
+        batch_size=BATCH_SIZE,
+        metrics=metrics,
+        exclude_none=True,
+    ) as writer:
+        for record in tqdm(iter_json_records(path), desc="Uploading doctors to database"):
+            if isinstance(record.get("link"), str):
+                # The key the scraper writes, so both upsert the same row
+                record["link"] = canonical_link(record["link"])
+            try:
+                with metrics.time("validate"):
+                    doctor = DoctorFromSite.model_validate(record)
+            except ValidationError as e:
+                invalid += 1
+                print(f"Skipping invalid record {record.get('link')}: {e}")
+                continue
+            if not doctor.model_dump(exclude={"link"}, exclude_none=True):
+                # A seed row with nothing but the link; upserting it would
+                # only risk the fields a scrape already stored
+                seeds += 1
+                continue
+            await writer.add(doctor)
+
+    metrics.write(METRICS_PATH)
+    print(metrics.summary())
+    print(
+        f"Uploaded {writer.written} doctors, {writer.failed} failed, "
+        f"{invalid} invalid, {seeds} without any scraped field skipped"
+    )
 
-with open("scraped_doctors.json", "r") as file:
-    doctors = json.load(file)
 
 if __name__ == "__main__":
-    with mp.Pool(mp.cpu_count()) as pool:
-        list(
-            tqdm(
-                pool.imap(
-                    lambda doctor: supabase.table("doctors").insert(doctor).execute(),
-                    doctors,
-                ),
-                total=len(doctors),
-                desc="Uploading doctors to database",
-            )
-        )
+    # Accepts the JSON array export or a JSON Lines variant of it
+    asyncio.run(upload_doctors(sys.argv[1] if len(sys.argv) > 1 else "scraped_doctors.json"))
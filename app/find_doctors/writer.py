@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Callable
+
+from pydantic import BaseModel
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
+
+
+class BatchWriter:
+    # Buffers rows and writes them as multi-row upserts keyed on `on_conflict`.
+    # A batch is flushed once it reaches `batch_size` rows, every `flush_interval`
+    # seconds and when the writer is closed. Use as
+    # `async with BatchWriter(client, "new_doctors") as writer:`. The optional
+    # callbacks are told which rows landed and which were given up on. With
+    # `exclude_none`, None fields are left out of the upsert, so a partial row
+    # never overwrites stored values with NULL.
+    def __init__(
+        self,
+        client,
+        table: str,
+        on_conflict: str = "link",
+        batch_size: int = 500,
+        flush_interval: float = 5.0,
+        retries: int = 5,
+        on_written: Callable[[list[dict]], None] | None = None,
+        on_failed: Callable[[list[dict], Exception], None] | None = None,
+        metrics=None,
+        exclude_none: bool = False,
+    ):
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self.buffer: dict[str, dict] = {}
+        self.lock = asyncio.Lock()
+        self.last_flush = time.monotonic()
+        self.flusher: asyncio.Task | None = None
+        self.exclude_none = exclude_none
+        self.written = 0
+        # Rows given up on; on_failed gets the rows themselves
+        self.failed = 0
+        # Optional metrics.Metrics: upsert latency, retries, errors and buffered rows
+        self.metrics = metrics
+
+    async def __aenter__(self):
+        self.flusher = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc):
+        self.flusher.cancel()
+        try:
+            await self.flusher
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+
+    async def add(self, row: BaseModel | dict):
+        if isinstance(row, BaseModel):
+            row = row.model_dump(mode="json", exclude_none=self.exclude_none)
+        elif self.exclude_none:
+            row = {key: value for key, value in row.items() if value is not None}
+        # Postgres rejects an upsert that touches the same key twice, so later
+        # rows for a key replace earlier ones within a batch
+        self.buffer[row[self.on_conflict]] = row
+        if self.metrics:
+            self.metrics.queue_depth("write_buffer", len(self.buffer))
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.buffer:
+                return
+            rows = list(self.buffer.values())
+            self.buffer = {}
+            self.last_flush = time.monotonic()
+            try:
+                async for attempt in AsyncRetrying(
+                    stop=stop_after_attempt(self.retries),
+                    wait=wait_exponential(multiplier=1, min=4, max=10),
+                    reraise=True,
+                ):
+                    if self.metrics and attempt.retry_state.attempt_number > 1:
+                        self.metrics.retry("write")
+                    with attempt:
+                        start = time.perf_counter()
+                        try:
+                            await asyncio.to_thread(self._upsert, rows)
+                        finally:
+                            if self.metrics:
+                                self.metrics.observe("write", time.perf_counter() - start)
+            except Exception as e:
+                print(f"Failed to write {len(rows)} rows to {self.table}: {e}")
+                if self.metrics:
+                    self.metrics.error("write", type(e).__name__)
+                self.failed += len(rows)
+                if self.on_failed:
+                    self.on_failed(rows, e)
+                return
+            self.written += len(rows)
+            if self.metrics:
+                self.metrics.count("write", len(rows))
+            if self.on_written:
+                self.on_written(rows)
+
+    def _upsert(self, rows: list[dict]):
+        # PostgREST sets a column missing from some rows of a bulk upsert to
+        # NULL, so rows are sent in one request per set of columns
+        by_columns: dict[frozenset, list[dict]] = {}
+        for row in rows:
+            by_columns.setdefault(frozenset(row), []).append(row)
+        for group in by_columns.values():
+            self.client.table(self.table).upsert(
+                group, on_conflict=self.on_conflict
+            ).execute()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                await self.flush()
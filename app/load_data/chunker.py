@@ -0,0 +1,101 @@
+import re
+import sys
+import uuid
+
+from pydantic import BaseModel
+
+from embedder import estimate_tokens
+
+# Chunks stay well inside one embedding's sweet spot; consecutive chunks share
+# up to OVERLAP_TOKENS of trailing sentences so an answer split across a
+# boundary is still found whole in one of them
+MAX_CHUNK_TOKENS = 300
+OVERLAP_TOKENS = 60
+
+# Fixed namespace so the same concept and chunk position always get the same id
+CHUNK_NAMESPACE = uuid.UUID("5b0e4d36-0d8a-4c57-9a43-6f1c0c3e8a21")
+
+# Sentence ends, and the question headings text.txt uses ("What is ALL? ...")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+
+class Chunk(BaseModel):
+    id: str
+    parent_id: str
+    index: int
+    text: str
+    tokens: int
+
+
+def concept_id(paragraph: str) -> str:
+    # Identifies a line of text.txt by its content
+    return str(uuid.uuid5(CHUNK_NAMESPACE, paragraph))
+
+
+def split_sentences(text: str, max_tokens: int = MAX_CHUNK_TOKENS) -> list[str]:
+    # Sentences, with any sentence longer than a whole chunk cut at word boundaries
+    sentences = []
+    for sentence in SENTENCE_BREAK.split(text.strip()):
+        if estimate_tokens(sentence) <= max_tokens:
+            sentences.append(sentence)
+            continue
+        piece = []
+        for word in sentence.split():
+            if piece and estimate_tokens(" ".join(piece + [word])) > max_tokens:
+                sentences.append(" ".join(piece))
+                piece = []
+            piece.append(word)
+        if piece:
+            sentences.append(" ".join(piece))
+    return [sentence for sentence in sentences if sentence]
+
+
+def chunk_paragraph(
+    paragraph: str,
+    max_tokens: int = MAX_CHUNK_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS,
+) -> list[Chunk]:
+    # Packs whole sentences into chunks of at most `max_tokens`. Short
+    # paragraphs come back as a single chunk identical to the input.
+    parent_id = concept_id(paragraph)
+    sentences = split_sentences(paragraph, max_tokens)
+    tokens = [estimate_tokens(sentence) for sentence in sentences]
+
+    chunks = []
+    start = 0
+    while start < len(sentences):
+        end, size = start, 0
+        while end < len(sentences) and (end == start or size + tokens[end] <= max_tokens):
+            size += tokens[end]
+            end += 1
+        text = " ".join(sentences[start:end])
+        chunks.append(
+            Chunk(
+                id=str(uuid.uuid5(CHUNK_NAMESPACE, f"{parent_id}:{len(chunks)}")),
+                parent_id=parent_id,
+                index=len(chunks),
+                text=text,
+                tokens=estimate_tokens(text),
+            )
+        )
+        if end == len(sentences):
+            break
+        # Step back over trailing sentences for the overlap, always moving forward
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + tokens[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += tokens[next_start]
+        start = next_start
+    return chunks
+
+
+if __name__ == "__main__":
+    # python chunker.py text.txt
+    with open(sys.argv[1] if len(sys.argv) > 1 else "text.txt", "r") as file:
+        paragraphs = [line.strip() for line in file if line.strip()]
+    chunks = [chunk for paragraph in paragraphs for chunk in chunk_paragraph(paragraph)]
+    sizes = sorted(chunk.tokens for chunk in chunks)
+    print(
+        f"{len(paragraphs)} paragraphs -> {len(chunks)} chunks; tokens per chunk "
+        f"p50 {sizes[len(sizes) // 2]}, max {sizes[-1]}"
+    )
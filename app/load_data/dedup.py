@@ -0,0 +1,129 @@
+import json
+import re
+import sys
+import zlib
+
+import numpy as np
+from pydantic import BaseModel
+
+# Words per shingle, and the Jaccard similarity of shingle sets above which two
+# paragraphs count as the same passage
+SHINGLE_SIZE = 5
+JACCARD_THRESHOLD = 0.8
+
+# 32 bands of 4 rows: pairs at the threshold become candidates with
+# probability ~1, pairs below 0.3 almost never do
+NUM_PERM = 128
+BANDS = 32
+
+# Embeddings at least this similar are the same text in different words
+COSINE_THRESHOLD = 0.97
+
+_PRIME = (1 << 31) - 1
+WORD = re.compile(r"\w+")
+
+
+class Collapsed(BaseModel):
+    # `dropped` was left out in favour of `kept`
+    kept: str
+    dropped: str
+    similarity: float
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode())}
+    return {
+        zlib.crc32(" ".join(words[i : i + size]).encode())
+        for i in range(len(words) - size + 1)
+    }
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.int64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.int64)
+
+    def signature(self, hashes: set[int]) -> np.ndarray:
+        x = np.fromiter(hashes, dtype=np.int64, count=len(hashes)) % _PRIME
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(a: set[int], b: set[int]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def dedupe_paragraphs(
+    paragraphs: list[str],
+    threshold: float = JACCARD_THRESHOLD,
+    bands: int = BANDS,
+    num_perm: int = NUM_PERM,
+) -> tuple[list[str], list[Collapsed]]:
+    # Keeps the first of every group of near-identical paragraphs, in input
+    # order. LSH over MinHash signatures proposes candidate pairs and the exact
+    # Jaccard similarity of their shingles decides.
+    hasher = MinHasher(num_perm)
+    rows = num_perm // bands
+    sets = [shingles(paragraph) for paragraph in paragraphs]
+    buckets: dict[tuple[int, bytes], list[int]] = {}
+    kept, collapsed = [], []
+    for i, paragraph in enumerate(paragraphs):
+        signature = hasher.signature(sets[i])
+        keys = [(band, signature[band * rows : (band + 1) * rows].tobytes()) for band in range(bands)]
+        candidates = {j for key in keys for j in buckets.get(key, [])}
+        best, similarity = None, 0.0
+        for j in sorted(candidates):
+            score = jaccard(sets[i], sets[j])
+            if score >= threshold and score > similarity:
+                best, similarity = j, score
+        if best is not None:
+            collapsed.append(Collapsed(kept=paragraphs[best], dropped=paragraph, similarity=similarity))
+            continue
+        # Only kept paragraphs go into the buckets, so a group collapses onto
+        # its first member rather than chaining through near neighbours
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+        kept.append(paragraph)
+    return kept, collapsed
+
+
+class CosineDeduper:
+    # Post-embedding pass: rejects a text whose embedding is within
+    # `threshold` cosine similarity of one already accepted. A `keep` text is
+    # never rejected, only recorded for later texts to collapse onto.
+    def __init__(self, dim: int = 1536, threshold: float = COSINE_THRESHOLD):
+        self.threshold = threshold
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)
+        self.texts: list[str] = []
+
+    def check(self, text: str, embedding: list[float], keep: bool = False) -> Collapsed | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1
+        count = len(self.texts)
+        if count and not keep:
+            similarities = self.vectors[:count] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return Collapsed(kept=self.texts[best], dropped=text, similarity=float(similarities[best]))
+        if count == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[count] = vector
+        self.texts.append(text)
+        return None
+
+
+def write_report(collapsed: list[Collapsed], path: str):
+    with open(path, "w") as file:
+        json.dump([entry.model_dump() for entry in collapsed], file, indent=2)
+
+
+if __name__ == "__main__":
+    # python dedup.py text.txt dedup_report.json
+    with open(sys.argv[1] if len(sys.argv) > 1 else "text.txt", "r") as file:
+        paragraphs = [line.strip() for line in file if line.strip()]
+    kept, collapsed = dedupe_paragraphs(paragraphs)
+    if len(sys.argv) > 2:
+        write_report(collapsed, sys.argv[2])
+    print(f"{len(paragraphs)} paragraphs -> {len(kept)} kept, {len(collapsed)} collapsed")
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import time
+
+from openai import AsyncOpenAI
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# The embeddings endpoint takes up to 2048 inputs and 300k tokens per request;
+# stay well under both by default
+MAX_BATCH_SIZE = 512
+MAX_BATCH_TOKENS = 100_000
+
+
+def estimate_tokens(text: str) -> int:
+    # English averages about four characters per token; counting one per three
+    # keeps batches safely under the limit without a tokenizer
+    return len(text) // 3 + 1
+
+
+def make_batches(
+    texts: list[str],
+    max_batch_size: int = MAX_BATCH_SIZE,
+    max_batch_tokens: int = MAX_BATCH_TOKENS,
+) -> list[list[int]]:
+    # Packs text indices, in order, into batches under both limits
+    batches = []
+    batch, batch_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BatchEmbedder:
+    # Embeds many paragraphs with few requests: texts are packed into
+    # token-budgeted batches, batches are sent concurrently, and the vectors
+    # come back in the order of the input. Point the client's base_url (or
+    # OPENAI_BASE_URL) at a local fake server to run it offline.
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        model: str = EMBEDDING_MODEL,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        concurrency: int = 4,
+        metrics=None,
+        limiter=None,
+    ):
+        self.client = client
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = 0
+        # Optional metrics.Metrics: latency and errors per request, retries
+        self.metrics = metrics
+        # Optional rate_control.AdaptiveLimiter: adaptive concurrency under
+        # shared request and token budgets, on top of `concurrency`; without
+        # one, requests are not rate limited
+        self.limiter = limiter
+
+    async def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        async with self.semaphore:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(5),
+                wait=wait_exponential(multiplier=1, min=4, max=10),
+                reraise=True,
+            ):
+                with attempt:
+                    if self.metrics and attempt.retry_state.attempt_number > 1:
+                        self.metrics.retry("embed")
+                    self.requests += 1
+                    tokens = sum(estimate_tokens(text) for text in texts)
+                    start = time.perf_counter()
+                    try:
+                        async with (
+                            self.limiter.request(tokens) if self.limiter else contextlib.nullcontext()
+                        ):
+                            response = await self.client.embeddings.create(
+                                input=texts, model=self.model
+                            )
+                    except Exception as e:
+                        if self.metrics:
+                            self.metrics.error("embed", type(e).__name__)
+                        raise
+                    finally:
+                        if self.metrics:
+                            self.metrics.observe("embed", time.perf_counter() - start)
+        if self.metrics:
+            self.metrics.count("embed", len(texts))
+        # The API tags every vector with the position of its input
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        batches = make_batches(texts, self.max_batch_size, self.max_batch_tokens)
+        results = await asyncio.gather(
+            *(self._embed_batch([texts[i] for i in batch]) for batch in batches)
+        )
+        embeddings: list[list[float] | None] = [None] * len(texts)
+        for batch, vectors in zip(batches, results):
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector
+        return embeddings
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+# Terms are lowercased runs of letters and digits, so drug names, gene names
+# and acronyms ("HbA1c", "IL-6", "COVID-19") are matched exactly; hyphenated
+# terms are also indexed joined up ("il6"), the way they are often typed
+TERM = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how in is it its of on or "
+    "that the their these this to was what when which who why will with you your".split()
+)
+
+# Weight of a term occurrence in each field, BM25F-style: a term in the title
+# counts as three in the article
+FIELD_WEIGHTS = {"tag": 3.0, "summary": 2.0, "article": 1.0}
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str | None) -> list[str]:
+    terms = []
+    for term in TERM.findall((text or "").lower()):
+        if "-" in term:
+            terms.append(term.replace("-", ""))
+            terms.extend(part for part in term.split("-") if part not in STOPWORDS)
+        elif term not in STOPWORDS:
+            terms.append(term)
+    return terms
+
+
+def build_lexical(path: str) -> int:
+    # Inverted index over the tag, summary and article of every row of an
+    # index directory: for each term, the rows containing it (ascending) and
+    # the term's field-weighted frequency in each. Returns the vocabulary size.
+    frequencies: dict[str, dict[int, float]] = {}
+    lengths = []
+    with open(os.path.join(path, "records.jsonl"), "r") as file:
+        for row, line in enumerate(file):
+            record = json.loads(line)
+            length = 0.0
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in tokenize(record.get(field)):
+                    postings = frequencies.setdefault(term, {})
+                    postings[row] = postings.get(row, 0.0) + weight
+                    length += weight
+            lengths.append(length)
+
+    terms = sorted(frequencies)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(frequencies[term]) for term in terms])
+    rows = np.empty(offsets[-1], dtype=np.int32)
+    tf = np.empty(offsets[-1], dtype=np.float32)
+    for i, term in enumerate(terms):
+        postings = frequencies[term]
+        rows[offsets[i] : offsets[i + 1]] = list(postings)
+        tf[offsets[i] : offsets[i + 1]] = list(postings.values())
+
+    np.save(os.path.join(path, "bm25_offsets.npy"), offsets)
+    np.save(os.path.join(path, "bm25_rows.npy"), rows)
+    np.save(os.path.join(path, "bm25_tf.npy"), tf)
+    np.save(os.path.join(path, "bm25_lengths.npy"), np.asarray(lengths, dtype=np.float32))
+    with open(os.path.join(path, "bm25.json"), "w") as file:
+        json.dump({"terms": terms, "k1": K1, "b": B, "field_weights": FIELD_WEIGHTS}, file)
+    return len(terms)
+
+
+class LexicalIndex:
+    # Read side of build_lexical. search() ranks rows by Okapi BM25 over the
+    # field-weighted term frequencies and, like VectorIndex.search, keeps the
+    # best chunk of each concept.
+    def __init__(self, path: str, records: list[dict] | None = None):
+        self.path = path
+        with open(os.path.join(path, "bm25.json"), "r") as file:
+            meta = json.load(file)
+        self.terms = {term: i for i, term in enumerate(meta["terms"])}
+        self.k1, self.b = meta["k1"], meta["b"]
+        self.offsets = np.load(os.path.join(path, "bm25_offsets.npy"))
+        self.rows = np.load(os.path.join(path, "bm25_rows.npy"), mmap_mode="r")
+        self.tf = np.load(os.path.join(path, "bm25_tf.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "bm25_lengths.npy"))
+        self.count = len(self.lengths)
+        self.average_length = float(self.lengths.mean()) if self.count else 0.0
+        # Length normalization of each row, the K of the BM25 formula
+        self.norms = self.k1 * (1 - self.b + self.b * self.lengths / (self.average_length or 1))
+
+        # The records are shared with a VectorIndex over the same directory
+        if records is None:
+            with open(os.path.join(path, "records.jsonl"), "r") as file:
+                records = [json.loads(line) for line in file]
+        self.records = records
+        self.groups = [record["parent_id"] or record["id"] for record in records]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def known(self, terms: list[str]) -> bool:
+        return all(term in self.terms for term in terms)
+
+    def document_frequency(self, term: str) -> int:
+        i = self.terms.get(term)
+        return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+    def search(self, query: str, match_count: int) -> list[tuple[int, float]]:
+        # (row, score) pairs, best first; rows without any query term are left out
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.terms.get(term)
+            if i is None:
+                continue
+            rows = np.asarray(self.rows[self.offsets[i] : self.offsets[i + 1]])
+            tf = np.asarray(self.tf[self.offsets[i] : self.offsets[i + 1]])
+            idf = np.log(1 + (self.count - len(rows) + 0.5) / (len(rows) + 0.5))
+            # Each row appears once per term, so fancy-index addition is safe
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self.norms[rows])
+
+        matched = np.flatnonzero(scores)
+        results, seen = [], set()
+        for row in matched[np.argsort(-scores[matched], kind="stable")]:
+            group = self.groups[row]
+            if group in seen:
+                continue
+            seen.add(group)
+            results.append((int(row), float(scores[row])))
+            if len(results) >= match_count:
+                break
+        return results
+
+    def match(self, query: str, match_count: int) -> list[dict]:
+        return [
+            {**self.records[row], "score": score} for row, score in self.search(query, match_count)
+        ]
+
+
+if __name__ == "__main__":
+    # python lexical_index.py build knowledge_index
+    # python lexical_index.py search knowledge_index "query" [count]
+    command, path, *rest = sys.argv[1:]
+    if command == "build":
+        print(f"Indexed {build_lexical(path)} terms for {path}")
+    elif command == "search":
+        for record in LexicalIndex(path).match(rest[0], int(rest[1]) if len(rest) > 1 else 5):
+            print(f"{record['score']:8.3f}  {record['tag']}")
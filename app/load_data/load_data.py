@@ -1,17 +1,110 @@
+import asyncio
+import contextlib
+import functools
 from typing import Literal, Optional
 import openai
-from openai import OpenAI
-import supabase
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
+import sys
 from enum import Enum
-from pydantic import BaseModel
-import multiprocessing
+from pydantic import BaseModel, ValidationError
 from tqdm import tqdm
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from chunker import chunk_paragraph, concept_id
+from dedup import Collapsed, CosineDeduper, dedupe_paragraphs, write_report
+from embedder import BatchEmbedder, estimate_tokens
+from lexical_index import build_lexical
+from pipeline import IngestionPipeline, MicroBatcher
+from result_cache import ResultCache, cache_key
+from vector_index import VectorIndexWriter, build_ivf, write_compact
+
+# clients.py, metrics.py and rate_control.py are shared with the doctor scrapers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "find_doctors"))
+from clients import get_supabase_client
+from metrics import Metrics
+from rate_control import AdaptiveLimiter
 
 load_dotenv("../../.env.local")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+# The OpenAI client is created on first use, like clients.get_supabase_client,
+# so importing this module needs no credentials. OPENAI_BASE_URL can point it
+# at a local stand-in (see app/benchmark).
+@functools.cache
+def get_async_client():
+    # No retries inside the client: every 429 has to reach the limiters, and
+    # the tenacity decorators retry instead
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+CONCEPT_MODEL = "gpt-4o-mini-2024-07-18"
+CONCEPT_PROMPT = "Provide a title, summary, and category for the following medical concept:\n\n{paragraph} Pick between the following options for the category you decide: Cardiovascular, Respiratory, Gastrointestinal, Endocrine, Hematological, Infectious, Musculoskeletal, Autoimmune, Cancer, Neurological."
+CONCEPT_BATCH_PROMPT = "Provide a title, summary, and category for each of the following medical concepts. Each concept starts with its id in square brackets; return exactly one entry per concept, with that id. Pick between the following options for the category you decide: Cardiovascular, Respiratory, Gastrointestinal, Endocrine, Hematological, Infectious, Musculoskeletal, Autoimmune, Cancer, Neurological.\n\n{paragraphs}"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Concept details and embeddings of paragraphs seen before, so re-runs only pay
+# for new or edited paragraphs
+CACHE_PATH = "result_cache.sqlite3"
+
+# Pipeline knobs: concurrent classification requests, concurrent embedding
+# batches, paragraphs per embedding request, rows per insert, and the most
+# paragraphs held between reading and writing
+CLASSIFY_CONCURRENCY = 16
+EMBED_CONCURRENCY = 2
+EMBED_BATCH_SIZE = 256
+WRITE_BATCH_SIZE = 200
+MAX_IN_FLIGHT = 2000
+
+# The concurrent requests above are where each API starts; from there the
+# limit follows how the API copes (see find_doctors/rate_control.py), up to the
+# maxima, within the account's per-minute request and token rate limits
+CLASSIFY_MAX_CONCURRENCY = 64
+EMBED_MAX_CONCURRENCY = 8
+COMPLETION_REQUESTS_PER_MINUTE = 5000
+COMPLETION_TOKENS_PER_MINUTE = 2_000_000
+EMBEDDING_REQUESTS_PER_MINUTE = 3000
+EMBEDDING_TOKENS_PER_MINUTE = 1_000_000
+# Answer tokens counted against the budget per paragraph classified
+CONCEPT_ANSWER_TOKENS = 150
+
+# Paragraphs classified per completion request, so the instructions are sent
+# once per batch rather than once per paragraph; 1 makes one request per
+# paragraph. A batch is sent when full or CONCEPT_BATCH_WAIT seconds after its
+# first paragraph. Paragraphs a batch answer leaves out are classified alone.
+CONCEPT_BATCH_SIZE = 8
+CONCEPT_BATCH_WAIT = 0.2
+
+# Near-duplicate paragraphs (Jaccard similarity of word shingles) are dropped
+# before any API call; with COSINE_DEDUP, chunks whose embedding is nearly
+# identical to one already written are dropped too. Both are listed in
+# DEDUP_REPORT_PATH.
+DEDUP_THRESHOLD = 0.8
+COSINE_DEDUP = False
+DEDUP_REPORT_PATH = "dedup_report.json"
+
+# Local copy of the knowledge embeddings, searchable with vector_index.VectorIndex
+# the way match_documents searches the table, plus a BM25 index of the same
+# rows (lexical_index.py); retriever.py fuses the two
+INDEX_PATH = "knowledge_index"
+# Optional compact copy the local index scans before reranking on the full
+# vectors: "float16" or "int8", optionally truncated to the first
+# INDEX_DIMS components. None keeps only the full float32 vectors.
+INDEX_STORAGE = None
+INDEX_DIMS = None
+
+# Embeddings are stored as float32, so digits past the 7th are noise; sending
+# them as a pgvector literal at that precision halves the insert payload
+EMBEDDING_DIGITS = 7
+
+# Stage timings, errors, retries and queue depths of the run, see metrics.py
+METRICS_PATH = "load_data_metrics.prom"
+metrics = Metrics("load_data")
+
+
+def count_retry(stage):
+    # tenacity before_sleep hook
+    return lambda retry_state: metrics.retry(stage)
 
 
 class ConceptDetails(BaseModel):
@@ -31,70 +124,300 @@ class ConceptDetails(BaseModel):
     ]
 
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=4, max=10))
-def generate_concept_details(paragraph):
-    prompt = f"Provide a title, summary, and category for the following medical concept:\n\n{paragraph} Pick between the following options for the category you decide: Cardiovascular, Respiratory, Gastrointestinal, Endocrine, Hematological, Infectious, Musculoskeletal, Autoimmune, Cancer, Neurological."
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    before_sleep=count_retry("classify"),
+)
+async def generate_concept_details(paragraph, limiter: AdaptiveLimiter | None = None):
+    prompt = CONCEPT_PROMPT.format(paragraph=paragraph)
 
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-mini-2024-07-18",
-        messages=[{"role": "system", "content": prompt}],
-        response_format=ConceptDetails,
-    )
+    tokens = estimate_tokens(prompt) + CONCEPT_ANSWER_TOKENS
+    async with limiter.request(tokens) if limiter else contextlib.nullcontext():
+        completion = await get_async_client().beta.chat.completions.parse(
+            model=CONCEPT_MODEL,
+            messages=[{"role": "system", "content": prompt}],
+            response_format=ConceptDetails,
+        )
 
     return completion.choices[0].message.parsed
 
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=4, max=10))
-def get_embedding(text, model="text-embedding-3-small"):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+class IdentifiedConceptDetails(ConceptDetails):
+    id: str
 
 
-# Initialize Supabase client
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
+class ConceptDetailsBatch(BaseModel):
+    concepts: list[IdentifiedConceptDetails]
 
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=4, max=10))
-def save_to_supabase(title, summary, paragraph, embedding, category):
-    data = {
-        "tag": title,
-        "summary": summary,
-        "article": paragraph,
-        "embedding": embedding,
-        "category": category,
+# Only API errors are retried; an answer that does not parse is not
+@retry(
+    retry=retry_if_exception_type(openai.APIError),
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    before_sleep=count_retry("classify_batch"),
+    reraise=True,
+)
+async def generate_concept_details_batch(
+    paragraphs: dict[str, str], limiter: AdaptiveLimiter | None = None
+) -> dict[str, ConceptDetails]:
+    # One request for several paragraphs, keyed by id. Ids the answer leaves
+    # out, repeats or makes up are not in the result.
+    prompt = CONCEPT_BATCH_PROMPT.format(
+        paragraphs="\n\n".join(f"[{id}] {paragraph}" for id, paragraph in paragraphs.items())
+    )
+
+    tokens = estimate_tokens(prompt) + CONCEPT_ANSWER_TOKENS * len(paragraphs)
+    async with limiter.request(tokens) if limiter else contextlib.nullcontext():
+        completion = await get_async_client().beta.chat.completions.parse(
+            model=CONCEPT_MODEL,
+            messages=[{"role": "system", "content": prompt}],
+            response_format=ConceptDetailsBatch,
+        )
+
+    batch = completion.choices[0].message.parsed
+    if batch is None:
+        return {}
+    ids = [concept.id for concept in batch.concepts]
+    return {
+        concept.id: ConceptDetails(**concept.model_dump(exclude={"id"}))
+        for concept in batch.concepts
+        if concept.id in paragraphs and ids.count(concept.id) == 1
     }
 
-    response = supabase_client.table("knowledge").insert(data).execute()
-    return response
 
+def format_vector(embedding, digits=EMBEDDING_DIGITS):
+    return "[" + ",".join(f"{value:.{digits}g}" for value in embedding) + "]"
 
-def process_paragraph(paragraph):
-    obj = generate_concept_details(paragraph)
-    embedding = get_embedding(paragraph)
-    return obj.title, obj.summary, paragraph, embedding, obj.category
 
+def concept_cache_key(paragraph, prompt=CONCEPT_PROMPT):
+    # Keyed by the template that produced the answer, so editing either
+    # prompt only invalidates the answers it gave
+    return cache_key(CONCEPT_MODEL, prompt, paragraph)
 
-if __name__ == "__main__":
 
-    with open("text.txt", "r") as file:
-        paragraphs = [line.strip() for line in file if line.strip()]
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    before_sleep=count_retry("write"),
+)
+async def save_to_supabase(rows):
+    # The supabase client is synchronous; keep the upsert off the event loop.
+    # Chunk ids are stable, so re-running over the same text replaces rows.
+    query = get_supabase_client().table("knowledge").upsert(rows, on_conflict="id")
+    with metrics.time("write"):
+        return await asyncio.to_thread(query.execute)
 
-    with tqdm(total=len(paragraphs), desc="Processing paragraphs") as pbar:
 
-        def update_progress(result):
-            pbar.update(1)
-            if result is None:
-                return
-            title, summary, paragraph, embedding, category = result
-            save_to_supabase(title, summary, paragraph, embedding, category)
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    before_sleep=count_retry("prune"),
+)
+async def prune_knowledge(keep):
+    # Deletes every knowledge row whose id is not in `keep` (see the
+    # prune_knowledge migration) and returns how many went
+    query = get_supabase_client().rpc("prune_knowledge", {"p_keep": keep})
+    with metrics.time("prune"):
+        response = await asyncio.to_thread(query.execute)
+    return response.data or 0
 
-        with multiprocessing.Pool(5) as pool:
-            for paragraph in paragraphs:
-                pool.apply_async(
-                    process_paragraph, args=(paragraph,), callback=update_progress
+
+async def load_paragraphs(
+    paragraphs, cache: ResultCache, index: VectorIndexWriter, collapsed: list[Collapsed]
+):
+    # One limiter per API, shared by every request of the run
+    completion_limiter = AdaptiveLimiter(
+        "classify",
+        initial=CLASSIFY_CONCURRENCY,
+        maximum=CLASSIFY_MAX_CONCURRENCY,
+        requests_per_minute=COMPLETION_REQUESTS_PER_MINUTE,
+        tokens_per_minute=COMPLETION_TOKENS_PER_MINUTE,
+        metrics=metrics,
+    )
+    embedding_limiter = AdaptiveLimiter(
+        "embed",
+        initial=EMBED_CONCURRENCY,
+        maximum=EMBED_MAX_CONCURRENCY,
+        requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+        metrics=metrics,
+    )
+    embedder = BatchEmbedder(
+        get_async_client(),
+        model=EMBEDDING_MODEL,
+        concurrency=EMBED_MAX_CONCURRENCY,
+        metrics=metrics,
+        limiter=embedding_limiter,
+    )
+
+    # Each paragraph is classified once, as a whole, and every chunk of it is
+    # embedded and stored on its own with the paragraph's title and category
+    chunks = [chunk for paragraph in paragraphs for chunk in chunk_paragraph(paragraph)]
+    parents = {concept_id(paragraph): paragraph for paragraph in paragraphs}
+    concepts: dict[str, asyncio.Task] = {}
+    deduper = CosineDeduper() if COSINE_DEDUP else None
+    # Ids of the chunks written by this run
+    stored: set[str] = set()
+
+    async def classify_one(paragraph):
+        with metrics.time("classify"):
+            obj = await generate_concept_details(paragraph, completion_limiter)
+        metrics.count("classify")
+        cache.put(concept_cache_key(paragraph), obj.model_dump_json().encode())
+        return obj
+
+    async def classify_batch(batch):
+        ids = [f"p{i}" for i in range(1, len(batch) + 1)]
+        try:
+            with metrics.time("classify_batch"):
+                found = await generate_concept_details_batch(dict(zip(ids, batch)), completion_limiter)
+        except (openai.OpenAIError, ValidationError):
+            found = {}
+        metrics.count("classify_batch", len(found))
+        for i, id in enumerate(ids):
+            if id in found:
+                cache.put(
+                    concept_cache_key(batch[i], CONCEPT_BATCH_PROMPT),
+                    found[id].model_dump_json().encode(),
                 )
+        missing = [i for i, id in enumerate(ids) if id not in found]
+        if missing:
+            metrics.count("classify_fallback", len(missing))
+        fallback = await asyncio.gather(*(classify_one(batch[i]) for i in missing))
+        found.update((ids[i], obj) for i, obj in zip(missing, fallback))
+        return [found[id] for id in ids]
+
+    async def classify_paragraph(paragraph):
+        # An answer from either prompt is reused, the one in use first;
+        # classify_one and classify_batch cache what they get
+        prompts = [CONCEPT_PROMPT, CONCEPT_BATCH_PROMPT]
+        for prompt in reversed(prompts) if batcher else prompts:
+            cached = cache.get(concept_cache_key(paragraph, prompt))
+            if cached is not None:
+                metrics.count("classify_cached")
+                return ConceptDetails.model_validate_json(cached)
+        if batcher:
+            return await batcher.submit(paragraph)
+        return await classify_one(paragraph)
+
+    async def classify(chunk):
+        if chunk.parent_id not in concepts:
+            concepts[chunk.parent_id] = asyncio.create_task(
+                classify_paragraph(parents[chunk.parent_id])
+            )
+        return await concepts[chunk.parent_id]
+
+    async def embed(batch):
+        # Only the chunks not seen before go to the API
+        texts = [chunk.text for chunk in batch]
+        keys = [cache_key(EMBEDDING_MODEL, text) for text in texts]
+        embeddings = [cache.get_embedding(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        metrics.count("embed_cached", len(texts) - len(missing))
+        if missing:
+            vectors = await embedder.embed([texts[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                embeddings[i] = vector
+                cache.put_embedding(keys[i], vector)
+        return embeddings
+
+    async def write(batch):
+        if deduper:
+            unique = []
+            for chunk, obj, embedding in batch:
+                # The category browse lists concepts by their chunk 0, so a
+                # concept's first chunk is always stored
+                duplicate = deduper.check(chunk.text, embedding, keep=chunk.index == 0)
+                if duplicate:
+                    collapsed.append(duplicate)
+                else:
+                    unique.append((chunk, obj, embedding))
+            batch = unique
+        rows = [
+            {
+                "id": chunk.id,
+                "parent_id": chunk.parent_id,
+                "chunk_index": chunk.index,
+                "tag": obj.title,
+                "summary": obj.summary,
+                "article": chunk.text,
+                "embedding": format_vector(embedding),
+                "category": obj.category,
+            }
+            for chunk, obj, embedding in batch
+        ]
+        await save_to_supabase(rows)
+        metrics.count("write", len(rows))
+        stored.update(row["id"] for row in rows)
+        for row, (_, _, embedding) in zip(rows, batch):
+            index.add(row, embedding)
+        cache.commit()
+
+    if CONCEPT_BATCH_SIZE > 1:
+        batching = MicroBatcher(
+            classify_batch,
+            CONCEPT_BATCH_SIZE,
+            wait=CONCEPT_BATCH_WAIT,
+            concurrency=CLASSIFY_MAX_CONCURRENCY,
+        )
+    else:
+        batching = contextlib.nullcontext()
+
+    async with batching as batcher:
+        with tqdm(total=len(chunks), desc="Processing chunks") as pbar:
+            pipeline = IngestionPipeline(
+                classify,
+                embed,
+                write,
+                # Enough paragraphs waiting on classification to fill every batch
+                classify_concurrency=CLASSIFY_MAX_CONCURRENCY * max(CONCEPT_BATCH_SIZE, 1),
+                embed_concurrency=EMBED_MAX_CONCURRENCY,
+                embed_batch_size=EMBED_BATCH_SIZE,
+                write_batch_size=WRITE_BATCH_SIZE,
+                max_in_flight=MAX_IN_FLIGHT,
+                on_done=pbar.update,
+                metrics=metrics,
+            )
+            await pipeline.run(chunks)
+
+    # text.txt is the whole knowledge base: rows this run did not write belong
+    # to edited or removed concepts, to near duplicates, or to the un-chunked
+    # loads from before. Chunks that failed keep whatever row they had.
+    keep = stored | {chunk.id for chunk, _ in pipeline.failed}
+    if keep:
+        metrics.count("pruned", await prune_knowledge(sorted(keep)))
+    # The closed client cannot be reused; the next run creates a new one
+    await get_async_client().close()
+    get_async_client.cache_clear()
+    return pipeline
+
+
+if __name__ == "__main__":
+
+    with open("text.txt", "r") as file:
+        paragraphs = [line.strip() for line in file if line.strip()]
+
+    paragraphs, collapsed = dedupe_paragraphs(paragraphs, DEDUP_THRESHOLD)
+    duplicate_paragraphs = len(collapsed)
+    print(f"Collapsed {duplicate_paragraphs} near-duplicate paragraphs")
 
-            pool.close()
-            pool.join()
+    with ResultCache(CACHE_PATH) as cache, VectorIndexWriter(INDEX_PATH) as index:
+        pipeline = asyncio.run(load_paragraphs(paragraphs, cache, index, collapsed))
+        duplicate_chunks = len(collapsed) - duplicate_paragraphs
+        print(
+            f"Saved {pipeline.written - duplicate_chunks} chunks of {len(paragraphs)} paragraphs, "
+            f"{duplicate_chunks} near-duplicate chunks skipped, "
+            f"{len(pipeline.failed)} failed; "
+            f"cache: {cache.hits} hits, {cache.misses} misses"
+        )
+    write_report(collapsed, DEDUP_REPORT_PATH)
+    build_ivf(INDEX_PATH)
+    build_lexical(INDEX_PATH)
+    if INDEX_STORAGE or INDEX_DIMS:
+        write_compact(INDEX_PATH, INDEX_STORAGE or "float32", INDEX_DIMS)
+    for chunk, reason in pipeline.failed:
+        print(f"Failed: {chunk.id} {chunk.text[:60]!r}: {reason}")
+    metrics.write(METRICS_PATH)
+    print(metrics.summary())
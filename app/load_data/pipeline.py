@@ -0,0 +1,236 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+# Marks the end of a stage's input; each worker consumes exactly one
+_DONE = object()
+
+
+async def take_batch(queue: asyncio.Queue, size: int, wait: float) -> tuple[list, bool]:
+    # Blocks for the first item, then gathers up to `size` items for at most
+    # `wait` seconds. Returns the batch and whether the end marker was reached.
+    item = await queue.get()
+    if item is _DONE:
+        return [], True
+    batch = [item]
+    deadline = time.monotonic() + wait
+    while len(batch) < size:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            item = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+class MicroBatcher:
+    # Turns single calls into batched ones: submit() queues an item and waits
+    # for its result, while `concurrency` workers take up to `batch_size`
+    # queued items at a time (waiting at most `wait` seconds for a batch to
+    # fill) and make one `call_batch` for them, which returns a result per
+    # item, in order. Use as `async with MicroBatcher(...) as batcher:`.
+    def __init__(
+        self,
+        call_batch: Callable[[list[Any]], Awaitable[list[Any]]],
+        batch_size: int,
+        wait: float = 0.2,
+        concurrency: int = 4,
+    ):
+        self.call_batch = call_batch
+        self.batch_size = batch_size
+        self.wait = wait
+        self.concurrency = concurrency
+
+    async def __aenter__(self):
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        return self
+
+    async def __aexit__(self, *exc):
+        for _ in self.workers:
+            await self.queue.put(_DONE)
+        await asyncio.gather(*self.workers)
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _worker(self):
+        done = False
+        while not done:
+            batch, done = await take_batch(self.queue, self.batch_size, self.wait)
+            if not batch:
+                continue
+            try:
+                results = await self.call_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class IngestionPipeline:
+    # Items (paragraphs, or chunks of them) flow through three stages connected
+    # by bounded queues:
+    #
+    #   source -> classify (one call per item, `classify_concurrency` workers)
+    #          -> embed    (micro-batches of `embed_batch_size`, `embed_concurrency` workers)
+    #   both   -> write    (batches of `write_batch_size` or every `flush_interval` seconds)
+    #
+    # Classification and embedding of an item run side by side and are joined
+    # by position before the write. At most `max_in_flight` items are between
+    # the source and a finished write, so a slow stage stalls the source instead
+    # of buffering the whole input.
+    def __init__(
+        self,
+        classify: Callable[[Any], Awaitable[Any]],
+        embed: Callable[[list[Any]], Awaitable[list[list[float]]]],
+        write: Callable[[list[tuple[Any, Any, list[float]]]], Awaitable[None]],
+        classify_concurrency: int = 16,
+        embed_concurrency: int = 2,
+        embed_batch_size: int = 256,
+        embed_wait: float = 0.5,
+        write_batch_size: int = 200,
+        flush_interval: float = 2.0,
+        max_in_flight: int = 2000,
+        on_done: Callable[[int], None] | None = None,
+        metrics=None,
+    ):
+        self.classify = classify
+        self.embed = embed
+        self.write = write
+        self.classify_concurrency = classify_concurrency
+        self.embed_concurrency = embed_concurrency
+        self.embed_batch_size = embed_batch_size
+        self.embed_wait = embed_wait
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        # Called with the number of items finished (written or failed)
+        self.on_done = on_done
+        # Optional metrics.Metrics: queue depths, and items failed per stage
+        # (the stage callbacks count the errors themselves)
+        self.metrics = metrics
+
+        self.written = 0
+        self.failed: list[tuple[Any, str]] = []
+
+    def _finish(self, count: int):
+        for _ in range(count):
+            self.in_flight.release()
+        if self.on_done:
+            self.on_done(count)
+
+    def _fail(self, index: int, item: Any, stage: str, error: Exception):
+        # The other half of the item may still be running; remember the
+        # failure so its result is dropped instead of written
+        entry = self.pending.setdefault(index, {})
+        if entry.get("failed"):
+            del self.pending[index]
+            return
+        entry["failed"] = True
+        self.failed.append((item, f"{stage}: {error!r}"))
+        if self.metrics:
+            self.metrics.count(f"{stage}_failed")
+        if "concept" in entry or "embedding" in entry:
+            del self.pending[index]
+        self._finish(1)
+
+    async def _complete(self, index: int, item: Any, field: str, value: Any):
+        entry = self.pending.setdefault(index, {})
+        if entry.get("failed"):
+            del self.pending[index]
+            return
+        entry[field] = value
+        if "concept" in entry and "embedding" in entry:
+            del self.pending[index]
+            await self.write_queue.put((item, entry["concept"], entry["embedding"]))
+
+    async def _source(self, items: Iterable[Any]):
+        for index, item in enumerate(items):
+            await self.in_flight.acquire()
+            await self.classify_queue.put((index, item))
+            await self.embed_queue.put((index, item))
+            if self.metrics:
+                self.metrics.queue_depth("classify", self.classify_queue.qsize())
+                self.metrics.queue_depth("embed", self.embed_queue.qsize())
+                self.metrics.queue_depth("write", self.write_queue.qsize())
+        for _ in range(self.classify_concurrency):
+            await self.classify_queue.put(_DONE)
+        for _ in range(self.embed_concurrency):
+            await self.embed_queue.put(_DONE)
+
+    async def _classify_worker(self):
+        while (entry := await self.classify_queue.get()) is not _DONE:
+            index, item = entry
+            try:
+                concept = await self.classify(item)
+            except Exception as e:
+                self._fail(index, item, "classify", e)
+                continue
+            await self._complete(index, item, "concept", concept)
+
+    async def _embed_worker(self):
+        done = False
+        while not done:
+            batch, done = await take_batch(self.embed_queue, self.embed_batch_size, self.embed_wait)
+            if not batch:
+                continue
+            try:
+                embeddings = await self.embed([item for _, item in batch])
+            except Exception as e:
+                for index, item in batch:
+                    self._fail(index, item, "embed", e)
+                continue
+            for (index, item), embedding in zip(batch, embeddings):
+                await self._complete(index, item, "embedding", embedding)
+
+    async def _write_worker(self):
+        done = False
+        while not done:
+            batch, done = await take_batch(
+                self.write_queue, self.write_batch_size, self.flush_interval
+            )
+            if not batch:
+                continue
+            try:
+                await self.write(batch)
+            except Exception as e:
+                self.failed.extend((item, f"write: {e!r}") for item, _, _ in batch)
+                if self.metrics:
+                    self.metrics.count("write_failed", len(batch))
+            else:
+                self.written += len(batch)
+            self._finish(len(batch))
+
+    async def run(self, items: Iterable[Any]):
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.pending: dict[int, dict] = {}
+        self.classify_queue = asyncio.Queue(self.classify_concurrency * 2)
+        self.embed_queue = asyncio.Queue(self.embed_batch_size * self.embed_concurrency * 2)
+        self.write_queue = asyncio.Queue(self.write_batch_size * 2)
+
+        writer = asyncio.create_task(self._write_worker())
+        workers = [
+            *(asyncio.create_task(self._classify_worker()) for _ in range(self.classify_concurrency)),
+            *(asyncio.create_task(self._embed_worker()) for _ in range(self.embed_concurrency)),
+        ]
+        try:
+            await self._source(items)
+            await asyncio.gather(*workers)
+            await self.write_queue.put(_DONE)
+            await writer
+        except BaseException:
+            for task in (*workers, writer):
+                task.cancel()
+            raise
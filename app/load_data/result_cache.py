@@ -0,0 +1,112 @@
+import hashlib
+import sqlite3
+import time
+from array import array
+
+# 2 GB holds roughly 300k paragraphs' embeddings plus their concept details
+MAX_BYTES = 2 * 1024**3
+
+
+def cache_key(*parts: str) -> str:
+    # Content address of an API result: the model, the prompt template and the
+    # paragraph all have to match for a cached result to be reused
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # SQLite store of API results keyed by cache_key. Embeddings are kept as packed
+    # float32 (6 KB for 1536 dimensions instead of ~30 KB of JSON), and the least
+    # recently used entries are evicted once the cache grows past `max_bytes`.
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            create table if not exists results (
+                key text primary key,
+                value blob not null,
+                size integer not null,
+                last_used real not null
+            )
+            """
+        )
+        self.connection.execute(
+            "create index if not exists results_last_used on results (last_used)"
+        )
+        self.connection.commit()
+        self.size = self.connection.execute(
+            "select coalesce(sum(size), 0) from results"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key: str) -> bytes | None:
+        row = self.connection.execute(
+            "select value from results where key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute(
+            "update results set last_used = ? where key = ?", (time.time(), key)
+        )
+        return row[0]
+
+    def put(self, key: str, value: bytes):
+        previous = self.connection.execute(
+            "select size from results where key = ?", (key,)
+        ).fetchone()
+        self.connection.execute(
+            """
+            insert into results (key, value, size, last_used) values (?, ?, ?, ?)
+            on conflict (key) do update set
+                value = excluded.value, size = excluded.size, last_used = excluded.last_used
+            """,
+            (key, value, len(value), time.time()),
+        )
+        self.size += len(value) - (previous[0] if previous else 0)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the cache is at 90% of its budget
+        target = self.max_bytes * 0.9
+        rows = self.connection.execute(
+            "select key, size from results order by last_used"
+        )
+        evicted = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.connection.executemany("delete from results where key = ?", evicted)
+
+    def get_embedding(self, key: str) -> list[float] | None:
+        value = self.get(key)
+        if value is None:
+            return None
+        vector = array("f")
+        vector.frombytes(value)
+        return vector.tolist()
+
+    def put_embedding(self, key: str, embedding: list[float]):
+        self.put(key, array("f", embedding).tobytes())
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from lexical_index import LexicalIndex, tokenize
+from result_cache import ResultCache, cache_key
+from vector_index import VectorIndex
+
+load_dotenv("../../.env.local")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# load_data's result cache, which holds the query embeddings too
+CACHE_PATH = "result_cache.sqlite3"
+
+# Queries of at most KEYWORD_QUERY_TERMS terms, every one of them in the
+# vocabulary, are answered from the lexical index alone: no embedding round
+# trip, and exact terms (drug names, acronyms) rank first
+KEYWORD_QUERY_TERMS = 3
+# Reciprocal rank fusion: a row scores 1 / (RRF_K + rank) in each list it is
+# in, ranks from 1; 60 is the constant of the original RRF paper. Each list is
+# FUSION_DEPTH times the results asked for.
+RRF_K = 60
+FUSION_DEPTH = 4
+
+# The same threshold the search API passes to match_documents
+MATCH_THRESHOLD = 0.25
+
+
+class HybridRetriever:
+    # Fuses BM25 and vector search over one index directory (see load_data.py).
+    # `embed` turns a query into its embedding; it is only called for queries
+    # that miss the keyword fast path.
+    def __init__(self, path: str, embed: Callable[[str], list[float]]):
+        self.vectors = VectorIndex(path)
+        self.lexical = LexicalIndex(path, self.vectors.records)
+        self.records = self.vectors.records
+        self.groups = self.vectors.groups
+        self.embed = embed
+
+    def is_keyword_query(self, query: str) -> bool:
+        terms = tokenize(query)
+        return 0 < len(terms) <= KEYWORD_QUERY_TERMS and self.lexical.known(terms)
+
+    def search(
+        self,
+        query: str,
+        match_count: int = 5,
+        match_threshold: float = MATCH_THRESHOLD,
+        mode: str = "hybrid",
+    ) -> list[tuple[int, float]]:
+        # (row, score) pairs, best concept first. mode is "hybrid" (keyword
+        # fast path, otherwise fusion), "lexical" or "vector".
+        if mode == "lexical" or (mode == "hybrid" and self.is_keyword_query(query)):
+            return self.lexical.search(query, match_count)
+        depth = match_count * FUSION_DEPTH if mode == "hybrid" else match_count
+        vector = self.vectors.search(self.embed(query), match_threshold, depth)
+        if mode == "vector":
+            return vector
+
+        # Fused per concept: both lists already hold one row per concept, and
+        # the concept keeps the row of whichever list ranks it higher
+        scores: dict[str, float] = {}
+        best: dict[str, tuple[int, int]] = {}
+        for ranked in (self.lexical.search(query, depth), vector):
+            for rank, (row, _) in enumerate(ranked, 1):
+                group = self.groups[row]
+                scores[group] = scores.get(group, 0.0) + 1 / (RRF_K + rank)
+                if group not in best or rank < best[group][0]:
+                    best[group] = (rank, row)
+        fused = sorted(scores, key=lambda group: -scores[group])[:match_count]
+        return [(best[group][1], scores[group]) for group in fused]
+
+    def match(self, query: str, match_count: int = 5, mode: str = "hybrid") -> list[dict]:
+        return [
+            {**self.records[row], "score": score}
+            for row, score in self.search(query, match_count, mode=mode)
+        ]
+
+
+def cached_embedder(cache: ResultCache, model: str = EMBEDDING_MODEL):
+    # Query embeddings through the load_data result cache, so repeated
+    # benchmark runs make no API calls; also returns the round trips timed
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    round_trips = []
+
+    def embed(text: str) -> list[float]:
+        key = cache_key(model, text)
+        embedding = cache.get_embedding(key)
+        if embedding is None:
+            start = time.perf_counter()
+            embedding = client.embeddings.create(input=[text], model=model).data[0].embedding
+            round_trips.append(time.perf_counter() - start)
+            cache.put_embedding(key, embedding)
+            cache.commit()
+        return embedding
+
+    return embed, round_trips
+
+
+def benchmark_queries(retriever: HybridRetriever, queries: int, seed: int = 0) -> list[tuple[str, str]]:
+    # (query, concept) pairs from the index itself: each sampled concept's
+    # title, as a question would name it, and its two rarest article terms, the
+    # kind of exact keyword lookup vector search tends to rank poorly
+    firsts = {}
+    for row, group in enumerate(retriever.groups):
+        firsts.setdefault(group, row)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(list(firsts.values()), min(queries, len(firsts)), replace=False)
+    pairs = []
+    for row in picks:
+        record = retriever.records[row]
+        group = retriever.groups[row]
+        if record.get("tag"):
+            pairs.append((record["tag"], group))
+        terms = sorted(set(tokenize(record.get("article"))), key=retriever.lexical.document_frequency)
+        if len(terms) >= 2:
+            pairs.append((" ".join(terms[:2]), group))
+    return pairs
+
+
+def benchmark(path: str, cache_path: str, queries: int = 100, match_count: int = 5):
+    # Hit rate (the query's concept among the first `match_count`), mean
+    # reciprocal rank and search latency of vector-only, lexical-only and
+    # hybrid search. Latency is local search time; queries that need an
+    # embedding also pay the API round trip, reported separately.
+    with ResultCache(cache_path) as cache:
+        embed, round_trips = cached_embedder(cache)
+        retriever = HybridRetriever(path, embed)
+        pairs = benchmark_queries(retriever, queries)
+        # Embedded up front, so the timings below pay a cache lookup, not the API
+        for query, _ in pairs:
+            embed(query)
+
+        print(f"{'mode':<10}{'hit@' + str(match_count):>10}{'mrr':>10}{'p50 ms':>10}{'p99 ms':>10}{'embeds':>10}")
+        for mode in ("vector", "lexical", "hybrid"):
+            hits, reciprocal_ranks, latencies, embeds = [], [], [], 0
+            for query, group in pairs:
+                if mode == "vector" or (mode == "hybrid" and not retriever.is_keyword_query(query)):
+                    embeds += 1
+                start = time.perf_counter()
+                found = [retriever.groups[row] for row, _ in retriever.search(query, match_count, mode=mode)]
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits.append(group in found)
+                reciprocal_ranks.append(1 / (found.index(group) + 1) if group in found else 0.0)
+            print(
+                f"{mode:<10}{np.mean(hits):>10.3f}{np.mean(reciprocal_ranks):>10.3f}"
+                f"{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 99):>10.3f}"
+                f"{embeds:>10}"
+            )
+        if round_trips:
+            print(f"embedding round trip: p50 {np.percentile(round_trips, 50) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    # python retriever.py search knowledge_index "query" [count]
+    # python retriever.py bench knowledge_index [queries]
+    command, path, *rest = sys.argv[1:]
+    if command == "search":
+        with ResultCache(CACHE_PATH) as cache:
+            embed, _ = cached_embedder(cache)
+            retriever = HybridRetriever(path, embed)
+            for record in retriever.match(rest[0], int(rest[1]) if len(rest) > 1 else 5):
+                print(f"{record['score']:8.4f}  {record['tag']}")
+    elif command == "bench":
+        benchmark(path, CACHE_PATH, int(rest[0]) if rest else 100)
@@ -0,0 +1,314 @@
+import json
+import os
+import sys
+import time
+from typing import Literal
+
+import numpy as np
+
+Mode = Literal["exact", "ivf"]
+# Precision of the compact copy of the vectors that searches scan first
+Storage = Literal["float32", "float16", "int8"]
+
+# Metadata kept per vector, the columns match_documents returns
+FIELDS = ["id", "parent_id", "chunk_index", "tag", "summary", "article", "category"]
+
+# Built from vectors.f32 by build_ivf and write_compact, and from
+# records.jsonl by lexical_index.build_lexical
+DERIVED_FILES = [
+    "ivf_centroids.npy",
+    "ivf_rows.npy",
+    "ivf_offsets.npy",
+    "compact.npy",
+    "compact_scale.npy",
+    "compact.json",
+    "bm25.json",
+    "bm25_offsets.npy",
+    "bm25_rows.npy",
+    "bm25_tf.npy",
+    "bm25_lengths.npy",
+]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorIndexWriter:
+    # Streams rows to an index directory: unit-length float32 vectors appended
+    # to vectors.f32 and their metadata to records.jsonl, so building the index
+    # never holds more than one row in memory
+    def __init__(self, path: str, dim: int = 1536):
+        os.makedirs(path, exist_ok=True)
+        # IVF lists and compact vectors describe the previous contents
+        for name in DERIVED_FILES:
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        self.path = path
+        self.dim = dim
+        self.count = 0
+        self.vectors = open(os.path.join(path, "vectors.f32"), "wb")
+        self.records = open(os.path.join(path, "records.jsonl"), "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, record: dict, embedding: list[float]):
+        vector = np.asarray(embedding, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected a {self.dim}-dimensional embedding, got {vector.shape}")
+        self.vectors.write(_normalize(vector).tobytes())
+        self.records.write(json.dumps({field: record.get(field) for field in FIELDS}) + "\n")
+        self.count += 1
+
+    def close(self):
+        self.vectors.close()
+        self.records.close()
+        with open(os.path.join(self.path, "meta.json"), "w") as file:
+            json.dump({"count": self.count, "dim": self.dim}, file)
+
+
+def quantize(
+    vectors: np.ndarray, storage: Storage, dims: int | None = None
+) -> tuple[np.ndarray, np.ndarray | None]:
+    # Compact vectors for the first pass of a search: optionally truncated to
+    # their first `dims` components (text-embedding-3 models are trained so a
+    # renormalized prefix is itself a usable embedding), then stored as float16,
+    # or as int8 with one float32 scale per vector
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dims:
+        vectors = _normalize(vectors[:, :dims])
+    if storage == "int8":
+        scale = np.abs(vectors).max(axis=1) / 127
+        scale[scale == 0] = 1
+        codes = np.round(vectors / scale[:, None]).astype(np.int8)
+        return codes, scale.astype(np.float32)
+    return vectors.astype(np.float16 if storage == "float16" else np.float32), None
+
+
+def write_compact(path: str, storage: Storage, dims: int | None = None):
+    # Adds a compact copy of the vectors to an index directory; the full
+    # vectors stay for reranking
+    index = VectorIndex(path)
+    compact, scale = quantize(index.vectors, storage, dims)
+    np.save(os.path.join(path, "compact.npy"), compact)
+    if scale is not None:
+        np.save(os.path.join(path, "compact_scale.npy"), scale)
+    elif os.path.exists(os.path.join(path, "compact_scale.npy")):
+        os.remove(os.path.join(path, "compact_scale.npy"))
+    with open(os.path.join(path, "compact.json"), "w") as file:
+        json.dump({"storage": storage, "dims": dims}, file)
+
+
+def build_ivf(path: str, lists: int | None = None, iterations: int = 10, seed: int = 0) -> int:
+    # Spherical k-means over the stored vectors, the same partitioning an
+    # ivfflat index uses. Writes the centroids and each list's rows, grouped so
+    # a list is one contiguous slice of ivf_rows.npy.
+    index = VectorIndex(path)
+    vectors = index.vectors
+    count = len(vectors)
+    if count == 0:
+        return 0
+    lists = min(lists or max(1, int(np.sqrt(count))), count)
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(count, lists, replace=False)])
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        # An empty list keeps its old centroid
+        filled = np.bincount(assignments, minlength=lists) > 0
+        centroids[filled] = _normalize(sums[filled])
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    rows = np.argsort(assignments, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=lists))])
+    np.save(os.path.join(path, "ivf_centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(path, "ivf_rows.npy"), rows.astype(np.int64))
+    np.save(os.path.join(path, "ivf_offsets.npy"), offsets.astype(np.int64))
+    return lists
+
+
+class VectorIndex:
+    # Read side of an index directory. Vectors are memory-mapped; match() has
+    # the semantics of the match_documents function: cosine similarity of at
+    # least `match_threshold`, the best chunk of each concept, at most
+    # `match_count` rows, most similar first. With a compact copy (see
+    # write_compact) the scan runs over it and the best `match_count * rerank`
+    # rows are rescored with the full vectors.
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            meta = json.load(file)
+        self.count, self.dim = meta["count"], meta["dim"]
+        file_path = os.path.join(path, "vectors.f32")
+        if self.count:
+            self.vectors = np.memmap(file_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        with open(os.path.join(path, "records.jsonl"), "r") as file:
+            self.records = [json.loads(line) for line in file]
+        # Concept of each row; rows loaded before chunking are their own concept
+        self.groups = [record["parent_id"] or record["id"] for record in self.records]
+
+        self.centroids = self.ivf_rows = self.ivf_offsets = None
+        if os.path.exists(os.path.join(path, "ivf_centroids.npy")):
+            self.centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+            self.ivf_rows = np.load(os.path.join(path, "ivf_rows.npy"), mmap_mode="r")
+            self.ivf_offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+
+        self.compact = self.compact_scale = self.compact_dims = None
+        if os.path.exists(os.path.join(path, "compact.json")):
+            with open(os.path.join(path, "compact.json"), "r") as file:
+                self.compact_dims = json.load(file)["dims"]
+            self.compact = np.load(os.path.join(path, "compact.npy"), mmap_mode="r")
+            if os.path.exists(os.path.join(path, "compact_scale.npy")):
+                self.compact_scale = np.load(os.path.join(path, "compact_scale.npy"))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        # Rows of the `probes` lists whose centroids are closest to the query
+        if self.centroids is None:
+            raise ValueError(f"{self.path} has no IVF lists; run build_ivf first")
+        nearest = np.argsort(-(self.centroids @ query))[:probes]
+        return np.concatenate(
+            [self.ivf_rows[self.ivf_offsets[i] : self.ivf_offsets[i + 1]] for i in nearest]
+        )
+
+    def _compact_scores(self, rows: np.ndarray | None, query: np.ndarray) -> np.ndarray:
+        if self.compact_dims:
+            query = _normalize(query[: self.compact_dims])
+        compact = self.compact if rows is None else self.compact[rows]
+        scores = compact.astype(np.float32) @ query
+        if self.compact_scale is not None:
+            scores *= self.compact_scale if rows is None else self.compact_scale[rows]
+        return scores
+
+    def search(
+        self,
+        query_embedding: list[float] | np.ndarray,
+        match_threshold: float,
+        match_count: int,
+        mode: Mode = "exact",
+        probes: int = 10,
+        rerank: int = 4,
+    ) -> list[tuple[int, float]]:
+        # (row, similarity) pairs, for callers that only need positions.
+        # rerank=0 returns the compact scores as they are.
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        rows = self._candidates(query, probes) if mode == "ivf" else None
+        if self.compact is None:
+            similarities = self.vectors @ query if rows is None else self.vectors[rows] @ query
+        else:
+            similarities = self._compact_scores(rows, query)
+            if rerank:
+                keep = max(1, match_count * rerank)
+                if rows is None:
+                    rows = np.arange(self.count)
+                if keep < len(rows):
+                    rows = rows[np.argpartition(-similarities, keep - 1)[:keep]]
+                rows = np.sort(rows)
+                similarities = self.vectors[rows] @ query
+        if rows is None:
+            rows = np.arange(self.count)
+        keep = similarities >= match_threshold
+        rows, similarities = rows[keep], similarities[keep]
+
+        results, seen = [], set()
+        for i in np.argsort(-similarities, kind="stable"):
+            group = self.groups[rows[i]]
+            if group in seen:
+                continue
+            seen.add(group)
+            results.append((int(rows[i]), float(similarities[i])))
+            if len(results) >= match_count:
+                break
+        return results
+
+    def match(
+        self,
+        query_embedding: list[float] | np.ndarray,
+        match_threshold: float,
+        match_count: int,
+        mode: Mode = "exact",
+        probes: int = 10,
+        rerank: int = 4,
+    ) -> list[dict]:
+        return [
+            {**self.records[row], "similarity": similarity}
+            for row, similarity in self.search(
+                query_embedding, match_threshold, match_count, mode, probes, rerank
+            )
+        ]
+
+
+def benchmark(path: str, queries: int = 200, match_count: int = 5, noise: float = 0.05, seed: int = 0):
+    # Recall and latency of each mode against exact search over the full
+    # float32 vectors. Queries are stored vectors plus gaussian noise, so no
+    # embedding API is needed.
+    index = VectorIndex(path)
+    index.compact = None
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(index), min(queries, len(index)), replace=False)
+    query_vectors = _normalize(
+        np.array(index.vectors[picks]) + rng.normal(0, noise / np.sqrt(index.dim), (len(picks), index.dim))
+    )
+
+    def run(mode="exact", probes=10, rerank=4):
+        latencies, results = [], []
+        for query in query_vectors:
+            start = time.perf_counter()
+            results.append(
+                [row for row, _ in index.search(query, -1.0, match_count, mode, probes, rerank)]
+            )
+            latencies.append(time.perf_counter() - start)
+        return results, np.array(latencies) * 1000
+
+    def report(name, results, latencies, bytes_per_vector):
+        recall = np.mean(
+            [len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(results, exact)]
+        )
+        print(
+            f"{name:<28}{recall:>10.3f}{np.percentile(latencies, 50):>10.3f}"
+            f"{np.percentile(latencies, 99):>10.3f}{bytes_per_vector:>10}"
+        )
+
+    exact, latencies = run()
+    print(f"{'mode':<28}{'recall@' + str(match_count):>10}{'p50 ms':>10}{'p99 ms':>10}{'bytes':>10}")
+    report("exact float32", exact, latencies, index.dim * 4)
+    if index.centroids is not None:
+        lists = len(index.centroids)
+        for probes in sorted({1, 2, 4, 8, 16, 32, lists} & set(range(1, lists + 1))):
+            report(f"ivf/{probes} float32", *run("ivf", probes), index.dim * 4)
+
+    # Compact copies are built in memory here; write_compact persists one.
+    # float16 and int8 are widened to float32 per query, so they save memory
+    # and disk rather than scan time; truncation saves both.
+    for storage, dims in [("float16", None), ("int8", None), ("float32", 512), ("float16", 512), ("int8", 256)]:
+        index.compact, index.compact_scale = quantize(index.vectors, storage, dims)
+        index.compact_dims = dims
+        size = index.compact.shape[1] * index.compact.itemsize + (4 if storage == "int8" else 0)
+        name = f"{storage}" + (f"/{dims}d" if dims else "")
+        report(f"exact {name}", *run(rerank=0), size)
+        report(f"exact {name} +rerank", *run(rerank=4), size)
+    index.compact = None
+
+
+if __name__ == "__main__":
+    # python vector_index.py ivf knowledge_index [lists]
+    # python vector_index.py compact knowledge_index int8 [dims]
+    # python vector_index.py bench knowledge_index [queries]
+    command, path, *rest = sys.argv[1:]
+    if command == "ivf":
+        lists = build_ivf(path, int(rest[0]) if rest else None)
+        print(f"Built {lists} IVF lists for {path}")
+    elif command == "compact":
+        write_compact(path, rest[0], int(rest[1]) if len(rest) > 1 else None)
+        print(f"Wrote {rest[0]} vectors for {path}")
+    elif command == "bench":
+        benchmark(path, int(rest[0]) if rest else 200)
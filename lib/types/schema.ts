@@ -40,8 +40,10 @@ export type Database = {
         Row: {
           article: string | null
           category: Database["public"]["Enums"]["category"] | null
+          chunk_index: number | null
           embedding: string | null
           id: string
+          parent_id: string | null
           summary: string
           tag: string
           url: string | null
@@ -49,8 +51,10 @@ export type Database = {
         Insert: {
           article?: string | null
           category?: Database["public"]["Enums"]["category"] | null
+          chunk_index?: number | null
           embedding?: string | null
           id?: string
+          parent_id?: string | null
           summary: string
           tag: string
           url?: string | null
@@ -58,8 +62,10 @@ export type Database = {
         Update: {
           article?: string | null
           category?: Database["public"]["Enums"]["category"] | null
+          chunk_index?: number | null
           embedding?: string | null
           id?: string
+          parent_id?: string | null
           summary?: string
           tag?: string
           url?: string | null
@@ -80,6 +86,7 @@ export type Database = {
           region_url: string | null
           speciality: string | null
           speciality_link: string | null
+          specialties: string[] | null
         }
         Insert: {
           credentials?: string | null
@@ -94,6 +101,7 @@ export type Database = {
           region_url?: string | null
           speciality?: string | null
           speciality_link?: string | null
+          specialties?: string[] | null
         }
         Update: {
           credentials?: string | null
@@ -108,6 +116,7 @@ export type Database = {
           region_url?: string | null
           speciality?: string | null
           speciality_link?: string | null
+          specialties?: string[] | null
         }
         Relationships: []
       }
@@ -143,6 +152,22 @@ export type Database = {
       [_ in never]: never
     }
     Functions: {
+      find_doctors_by_location: {
+        Args: {
+          p_speciality: string
+          p_region: string
+          p_locality: string
+          p_limit?: number
+        }
+        Returns: Database["public"]["Tables"]["new_doctors"]["Row"][]
+      }
+      search_physicians: {
+        Args: {
+          p_query: string
+          p_region?: string
+        }
+        Returns: Database["public"]["Tables"]["new_doctors"]["Row"][]
+      }
       match_documents: {
         Args: {
           query_embedding: string
@@ -150,6 +175,9 @@ export type Database = {
           match_count: number
         }
         Returns: {
+          id: string
+          parent_id: string | null
+          chunk_index: number | null
           tag: string
           summary: string
           article: string
@@ -157,6 +185,12 @@ export type Database = {
           similarity: number
         }[]
       }
+      prune_knowledge: {
+        Args: {
+          p_keep: string[]
+        }
+        Returns: number
+      }
     }
     Enums: {
       category:
@@ -0,0 +1,7 @@
+delete from "public"."new_doctors" a
+    using "public"."new_doctors" b
+    where a.link = b.link and a.ctid > b.ctid;
+
+CREATE UNIQUE INDEX new_doctors_link_key ON public.new_doctors USING btree (link);
+
+alter table "public"."new_doctors" add constraint "new_doctors_link_key" UNIQUE using index "new_doctors_link_key";
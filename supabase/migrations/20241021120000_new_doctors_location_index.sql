@@ -0,0 +1,16 @@
+CREATE INDEX new_doctors_speciality_region_locality_idx ON public.new_doctors USING btree (speciality, region, locality);
+
+-- Doctors of a speciality in a region, the ones in the given locality first, so
+-- the city-level lookup and its state-level fallback are a single query
+CREATE OR REPLACE FUNCTION public.find_doctors_by_location(p_speciality text, p_region text, p_locality text, p_limit integer DEFAULT 10)
+ RETURNS SETOF new_doctors
+ LANGUAGE sql
+ STABLE
+AS $function$
+  select d.*
+  from new_doctors d
+  where d.speciality = p_speciality
+    and d.region = p_region
+  order by (d.locality is not distinct from p_locality) desc, d.last_name, d.first_name, d.link
+  limit p_limit;
+$function$;
@@ -0,0 +1,35 @@
+-- load_data stores each text.txt concept as one or more chunks; chunks of a
+-- concept share parent_id and are numbered from 0 by chunk_index
+alter table "public"."knowledge" add column "parent_id" uuid;
+
+alter table "public"."knowledge" add column "chunk_index" integer;
+
+CREATE INDEX knowledge_parent_id_chunk_index_idx ON public.knowledge USING btree (parent_id, chunk_index);
+
+-- Same threshold and count semantics as before, but the best chunk of each
+-- concept only, so one long article cannot fill every result slot
+DROP FUNCTION IF EXISTS public.match_documents(extensions.vector, double precision, integer);
+
+CREATE OR REPLACE FUNCTION public.match_documents(query_embedding extensions.vector, match_threshold double precision, match_count integer)
+ RETURNS TABLE(id uuid, parent_id uuid, chunk_index integer, tag text, summary text, article text, category category, similarity double precision)
+ LANGUAGE sql
+ STABLE
+AS $function$
+  select *
+  from (
+    select distinct on (coalesce(d.parent_id, d.id))
+      d.id,
+      d.parent_id,
+      d.chunk_index,
+      d.tag,
+      d.summary,
+      d.article,
+      d.category,
+      1 - (d.embedding <=> query_embedding) as similarity
+    from knowledge d
+    where (1 - (d.embedding <=> query_embedding)) >= match_threshold
+    order by coalesce(d.parent_id, d.id), d.embedding <=> query_embedding
+  ) best
+  order by best.similarity desc
+  limit match_count;
+$function$;
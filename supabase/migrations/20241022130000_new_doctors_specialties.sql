@@ -0,0 +1,5 @@
+-- Every directory listing (doctors_<specialty>.txt) a doctor appeared in, now
+-- that the scraper stores one row per doctor instead of one per listing
+alter table "public"."new_doctors" add column "specialties" text[];
+
+CREATE INDEX new_doctors_specialties_idx ON public.new_doctors USING gin (specialties);
@@ -0,0 +1,26 @@
+create extension if not exists "pg_trgm" with schema "extensions";
+
+-- Trigram index over the full name; serves both the substring match and the
+-- similarity match below, so name search no longer scans new_doctors
+CREATE INDEX new_doctors_name_trgm_idx ON public.new_doctors USING gin ((lower((coalesce(first_name, '') || ' ' || coalesce(last_name, '')))) extensions.gin_trgm_ops);
+
+-- Doctors whose name contains the query, then misspelled matches above
+-- pg_trgm.similarity_threshold (0.3 by default), best matches first
+CREATE OR REPLACE FUNCTION public.search_physicians(p_query text, p_region text DEFAULT NULL)
+ RETURNS SETOF new_doctors
+ LANGUAGE sql
+ STABLE
+ SET search_path = public, extensions
+AS $function$
+  select d.*
+  from new_doctors d
+  where (p_region is null or p_region = '' or d.region = p_region)
+    and (
+      lower(coalesce(d.first_name, '') || ' ' || coalesce(d.last_name, '')) like '%' || lower(p_query) || '%'
+      or lower(coalesce(d.first_name, '') || ' ' || coalesce(d.last_name, '')) % lower(p_query)
+    )
+  order by
+    lower(coalesce(d.first_name, '') || ' ' || coalesce(d.last_name, '')) like '%' || lower(p_query) || '%' desc,
+    similarity(lower(coalesce(d.first_name, '') || ' ' || coalesce(d.last_name, '')), lower(p_query)) desc,
+    d.last_name, d.first_name, d.link;
+$function$;
@@ -0,0 +1,88 @@
+-- The spelling of a profile link the scrapers and the upload store, the same
+-- as canonical_link in app/find_doctors/entity_resolution.py: Doximity
+-- /cv/<slug> and /pub/<slug>[/<n>] become https://www.doximity.com/pub/<slug>
+-- with the slug in lower case; other links lose their query, fragment and
+-- trailing slash
+CREATE OR REPLACE FUNCTION public.canonical_doctor_link(p_link text)
+ RETURNS text
+ LANGUAGE sql
+ IMMUTABLE
+AS $function$
+  select coalesce(
+    case
+      when lower(m[2]) like '%doximity.com' and m[3] ~ '^/(cv|pub)/[^/]+(/[0-9]+)?/?$'
+        then 'https://www.doximity.com/pub/' || lower(substring(m[3] from '^/(?:cv|pub)/([^/]+)'))
+      else m[1] || '://' || m[2] || rtrim(m[3], '/')
+    end,
+    p_link
+  )
+  from (select regexp_match(btrim(p_link), '^([^:/?#]+)://([^/?#]*)([^?#]*)') as m) parsed;
+$function$;
+
+-- Rows whose links canonicalize to the same profile are merged into one: the
+-- row already at the canonical link, else the most complete one, keeps its
+-- fields, takes the ones it lacks from the others and the specialties of all
+create temporary table doctor_links as
+select
+  id,
+  public.canonical_doctor_link(link) as canonical,
+  row_number() over (
+    partition by public.canonical_doctor_link(link)
+    order by
+      link = public.canonical_doctor_link(link) desc,
+      num_nonnulls(first_name, last_name, credentials, locality, locality_url, region, region_url, speciality, speciality_link, photo_url) desc,
+      id
+  ) as rank
+from new_doctors;
+
+update new_doctors d
+set
+  first_name = coalesce(d.first_name, g.first_name),
+  last_name = coalesce(d.last_name, g.last_name),
+  credentials = coalesce(d.credentials, g.credentials),
+  locality = coalesce(d.locality, g.locality),
+  locality_url = coalesce(d.locality_url, g.locality_url),
+  region = coalesce(d.region, g.region),
+  region_url = coalesce(d.region_url, g.region_url),
+  speciality = coalesce(d.speciality, g.speciality),
+  speciality_link = coalesce(d.speciality_link, g.speciality_link),
+  photo_url = coalesce(d.photo_url, g.photo_url),
+  specialties = coalesce(g.specialties, d.specialties)
+from doctor_links k
+cross join lateral (
+  select
+    (array_agg(o.first_name order by l.rank) filter (where o.first_name is not null))[1] as first_name,
+    (array_agg(o.last_name order by l.rank) filter (where o.last_name is not null))[1] as last_name,
+    (array_agg(o.credentials order by l.rank) filter (where o.credentials is not null))[1] as credentials,
+    (array_agg(o.locality order by l.rank) filter (where o.locality is not null))[1] as locality,
+    (array_agg(o.locality_url order by l.rank) filter (where o.locality_url is not null))[1] as locality_url,
+    (array_agg(o.region order by l.rank) filter (where o.region is not null))[1] as region,
+    (array_agg(o.region_url order by l.rank) filter (where o.region_url is not null))[1] as region_url,
+    (array_agg(o.speciality order by l.rank) filter (where o.speciality is not null))[1] as speciality,
+    (array_agg(o.speciality_link order by l.rank) filter (where o.speciality_link is not null))[1] as speciality_link,
+    (array_agg(o.photo_url order by l.rank) filter (where o.photo_url is not null))[1] as photo_url,
+    (
+      select array_agg(distinct s order by s)
+      from doctor_links l2
+      join new_doctors o2 on o2.id = l2.id
+      cross join unnest(o2.specialties) s
+      where l2.canonical = k.canonical
+    ) as specialties
+  from doctor_links l
+  join new_doctors o on o.id = l.id
+  where l.canonical = k.canonical
+) g
+where d.id = k.id
+  and k.rank = 1
+  and exists (select 1 from doctor_links l where l.canonical = k.canonical and l.rank > 1);
+
+delete from new_doctors d
+using doctor_links k
+where d.id = k.id and k.rank > 1;
+
+update new_doctors d
+set link = k.canonical
+from doctor_links k
+where d.id = k.id and d.link <> k.canonical;
+
+drop table doctor_links;
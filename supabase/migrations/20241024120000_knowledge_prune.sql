@@ -0,0 +1,27 @@
+-- Concepts stored before chunking are one row each with no parent_id, so
+-- match_documents ranked them apart from their chunks. They become chunk 0 of
+-- the concept load_data.py's concept_id gives their text (uuid5 in the same
+-- namespace), and the next load replaces them with the chunks.
+update knowledge
+set
+  parent_id = extensions.uuid_generate_v5('5b0e4d36-0d8a-4c57-9a43-6f1c0c3e8a21'::uuid, article),
+  chunk_index = 0
+where parent_id is null
+  and article is not null;
+
+-- Deletes every row not in p_keep, the ids of the chunks load_data.py just
+-- stored: rows from before chunking, chunks of edited or removed concepts and
+-- chunks dropped as near duplicates. An empty list deletes nothing. Returns
+-- the number of rows deleted.
+CREATE OR REPLACE FUNCTION public.prune_knowledge(p_keep uuid[])
+ RETURNS integer
+ LANGUAGE sql
+AS $function$
+  with deleted as (
+    delete from knowledge d
+    where cardinality(p_keep) > 0
+      and not (d.id = any(p_keep))
+    returning 1
+  )
+  select count(*)::integer from deleted;
+$function$;